@@ -0,0 +1,148 @@
+"""解码与重采样方式的基准测试
+
+比较各重采样方式相对当前默认路径(librosa.load + soxr_hq)的耗时，
+以及音符起始点、节拍和速度的一致程度。
+
+用法:
+    python -m benchmarks.bench_decode [音频文件 ...] [--json 输出文件]
+
+不指定音频文件时会生成一段44.1kHz立体声的合成测试音频。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+import soundfile as sf
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.audio.analyzer import AudioAnalyzer
+from src.audio.decode import RESAMPLERS, decode_audio
+from config import SAMPLE_RATE
+
+# 判断两个事件一致的时间容差(秒)
+TOLERANCE = 0.05
+
+
+def make_test_audio(path, duration=60.0, sr=44100, bpm=128):
+    """生成一段带节拍的立体声合成音频"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(duration * sr)) / sr
+    y = 0.1 * np.sin(2 * np.pi * 220 * t) + 0.02 * rng.standard_normal(len(t))
+    click = np.exp(-np.arange(2000) / 300.0)
+    for beat in np.arange(0, duration, 60.0 / bpm):
+        i = int(beat * sr)
+        n = min(len(click), len(y) - i)
+        y[i:i + n] += 0.6 * click[:n] * rng.standard_normal(n)
+    stereo = np.stack([y, 0.8 * y], axis=1).astype(np.float32)
+    sf.write(path, stereo, sr)
+
+
+def f_measure(reference, estimate, tolerance=TOLERANCE):
+    """计算两组事件时间的F值(每个参考事件最多匹配一个估计事件)"""
+    reference = np.sort(np.asarray(reference))
+    estimate = np.sort(np.asarray(estimate))
+    if len(reference) == 0 and len(estimate) == 0:
+        return 1.0
+    if len(reference) == 0 or len(estimate) == 0:
+        return 0.0
+
+    matched = 0
+    used = np.zeros(len(estimate), dtype=bool)
+    for time_ref in reference:
+        idx = np.searchsorted(estimate, time_ref)
+        for candidate in (idx - 1, idx):
+            if 0 <= candidate < len(estimate) and not used[candidate] \
+                    and abs(estimate[candidate] - time_ref) <= tolerance:
+                used[candidate] = True
+                matched += 1
+                break
+
+    precision = matched / len(estimate)
+    recall = matched / len(reference)
+    if precision + recall == 0:
+        return 0.0
+    return 2 * precision * recall / (precision + recall)
+
+
+def bench_file(path, repeat=3):
+    """对一个音频文件测试所有重采样方式"""
+    # 当前默认路径的解码耗时
+    start = time.perf_counter()
+    for _ in range(repeat):
+        librosa.load(path, sr=SAMPLE_RATE)
+    baseline_decode = (time.perf_counter() - start) / repeat
+
+    results = []
+    reference = None
+    for resampler in RESAMPLERS:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            decode_audio(path, resampler)
+        decode_time = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        features = AudioAnalyzer(path, resampler=resampler).extract_features()
+        total_time = time.perf_counter() - start
+
+        if reference is None:
+            reference = features
+
+        results.append({
+            'file': os.path.basename(path),
+            'resampler': resampler,
+            'decode_s': decode_time,
+            'decode_speedup': baseline_decode / decode_time,
+            'load_and_analyze_s': total_time,
+            'onset_f': f_measure(reference.onset_times, features.onset_times),
+            'beat_f': f_measure(reference.beat_times, features.beat_times),
+            'tempo_diff': abs(float(np.atleast_1d(features.tempo)[0])
+                              - float(np.atleast_1d(reference.tempo)[0]))
+        })
+    return baseline_decode, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='解码与重采样方式的基准测试')
+    parser.add_argument('files', nargs='*', help='音频文件路径')
+    parser.add_argument('--repeat', type=int, default=3, help='解码重复次数')
+    parser.add_argument('--json', help='把结果写入JSON文件')
+    args = parser.parse_args()
+
+    files = args.files
+    tmp_dir = None
+    if not files:
+        tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp_dir.name, 'synthetic_44k_stereo.wav')
+        make_test_audio(path)
+        files = [path]
+
+    # 预热numba编译，避免第一个测试项承担编译时间
+    AudioAnalyzer(files[0]).extract_features()
+
+    all_results = []
+    for path in files:
+        baseline_decode, results = bench_file(path, repeat=args.repeat)
+        print(f"\n{os.path.basename(path)}  (librosa.load 解码: {baseline_decode * 1000:.1f} ms)")
+        print(f"{'resampler':<10} {'decode ms':>10} {'speedup':>8} {'total s':>8} "
+              f"{'onset F':>8} {'beat F':>7} {'Δtempo':>7}")
+        for r in results:
+            print(f"{r['resampler']:<10} {r['decode_s'] * 1000:>10.1f} {r['decode_speedup']:>7.2f}x "
+                  f"{r['load_and_analyze_s']:>8.2f} {r['onset_f']:>8.3f} {r['beat_f']:>7.3f} "
+                  f"{r['tempo_diff']:>7.2f}")
+        all_results.extend(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(all_results, f, indent=2)
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+"""谱面生成流水线的基准测试
+
+在本地生成确定性的合成音频(不同BPM的节拍音轨、鼓点循环、正弦扫频和噪声，
+时长从30秒到60分钟)，分别测量音频分析的各个阶段、ChartGenerator.generate_chart、
+Chart.to_dict/from_dict 以及 ChartStorage 的保存和读取耗时。
+
+结果写入JSON文件；指定基准结果时，任何阶段比基准慢超过阈值都会以非零状态退出。
+
+用法:
+    python -m benchmarks.bench_pipeline [--preset quick|standard|full] [--json 输出文件]
+        [--baseline 基准文件] [--save-baseline] [--max-regression 0.25]
+
+超过 STREAMING_MIN_DURATION 的音频与线上一致，使用流式分析器测量。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import numpy as np
+import soundfile as sf
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.audio.analyzer import AudioAnalyzer
+from src.audio.streaming import StreamingAudioAnalyzer
+from src.chart.generator import ChartGenerator
+from src.chart.models import Chart
+from src.utils.chart_storage import ChartStorage
+from config import STREAMING_MIN_DURATION
+
+# 合成音频的种类：(名称, 种类, BPM)
+CORPUS_KINDS = [
+    ('click90', 'click', 90),
+    ('click120', 'click', 120),
+    ('click174', 'click', 174),
+    ('drums100', 'drums', 100),
+    ('sweep', 'sweep', None),
+    ('noise', 'noise', None),
+]
+
+# 各预设包含的音频时长(秒)
+PRESETS = {
+    'quick': (30,),
+    'standard': (30, 300),
+    'full': (30, 300, 3600),
+}
+
+# 默认的基准结果文件
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# 合成音频每次生成和写入的时长(秒)，长音频不会整体放在内存中
+BLOCK_SECONDS = 10.0
+
+# 扫频周期(秒)和频率范围(Hz)
+SWEEP_PERIOD = 10.0
+SWEEP_RANGE = (40.0, 8000.0)
+
+
+def _click_block(t, bpm, rng):
+    """节拍器音轨：每拍一个衰减的1kHz短音，每小节第一拍加重"""
+    period = 60.0 / bpm
+    beat = np.floor(t / period)
+    phase = t - beat * period
+    accent = np.where(beat % 4 == 0, 1.0, 0.6)
+    envelope = np.exp(-phase / 0.01) * (phase < 0.05)
+    return 0.8 * accent * envelope * np.sin(2 * np.pi * 1000.0 * t)
+
+
+def _drums_block(t, bpm, rng):
+    """鼓点循环：16分音符网格上的底鼓、军鼓和踩镲"""
+    step_length = 60.0 / bpm / 4
+    step = np.floor(t / step_length).astype(np.int64) % 16
+    phase = t - np.floor(t / step_length) * step_length
+    noise = rng.standard_normal(len(t))
+
+    # 底鼓：频率从120Hz下滑到50Hz的正弦
+    kick_freq = 50.0 + 70.0 * np.exp(-phase / 0.03)
+    kick = np.isin(step, (0, 7, 8, 10)) * np.exp(-phase / 0.12) * np.sin(2 * np.pi * kick_freq * phase)
+    snare = np.isin(step, (4, 12)) * np.exp(-phase / 0.06) * noise
+    hihat = (step % 2 == 0) * np.exp(-phase / 0.015) * np.diff(noise, prepend=0.0)
+    return 0.7 * kick + 0.4 * snare + 0.15 * hihat
+
+
+def _sweep_block(t, bpm, rng):
+    """对数正弦扫频，每个周期从低频扫到高频"""
+    low, high = SWEEP_RANGE
+    ratio = np.log(high / low)
+    tau = np.mod(t, SWEEP_PERIOD)
+    phase = 2 * np.pi * low * SWEEP_PERIOD / ratio * (np.exp(tau / SWEEP_PERIOD * ratio) - 1)
+    return 0.5 * np.sin(phase)
+
+
+def _noise_block(t, bpm, rng):
+    """白噪声"""
+    return 0.3 * rng.standard_normal(len(t))
+
+
+_GENERATORS = {
+    'click': _click_block,
+    'drums': _drums_block,
+    'sweep': _sweep_block,
+    'noise': _noise_block,
+}
+
+
+def make_corpus_audio(path, kind, bpm, duration, sr=44100, seed=0):
+    """分块生成一段确定性的合成音频并写入16位WAV文件
+
+    每块使用由 (seed, 块序号) 派生的随机数，相同参数总是生成完全相同的文件。
+
+    Args:
+        path: 输出文件路径
+        kind: 音频种类('click', 'drums', 'sweep', 'noise')
+        bpm: 节拍类音频的速度
+        duration: 时长(秒)
+        sr: 采样率
+        seed: 随机种子
+    """
+    generate = _GENERATORS[kind]
+    total = int(duration * sr)
+    block = int(BLOCK_SECONDS * sr)
+    tmp_path = path + '.tmp'
+    with sf.SoundFile(tmp_path, 'w', samplerate=sr, channels=1, subtype='PCM_16', format='WAV') as f:
+        for index, start in enumerate(range(0, total, block)):
+            t = np.arange(start, min(start + block, total)) / sr
+            rng = np.random.default_rng([seed, index])
+            f.write(np.clip(generate(t, bpm, rng), -1.0, 1.0))
+    os.replace(tmp_path, path)
+
+
+def build_corpus(corpus_dir, durations, sr=44100):
+    """生成(或复用已生成的)合成音频
+
+    Args:
+        corpus_dir: 存放音频的目录
+        durations: 音频时长列表(秒)
+        sr: 采样率
+
+    Returns:
+        list: (用例名称, 音频路径, 时长) 列表
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    cases = []
+    for duration in durations:
+        for name, kind, bpm in CORPUS_KINDS:
+            case = f"{name}_{duration}s"
+            path = os.path.join(corpus_dir, f"{case}_{sr}.wav")
+            if not os.path.exists(path):
+                make_corpus_audio(path, kind, bpm, duration, sr=sr)
+            cases.append((case, path, duration))
+    return cases
+
+
+def _timed(timings, stage, func, *args):
+    """执行 func 并把耗时(秒)记录到 timings[stage]"""
+    start = time.perf_counter()
+    result = func(*args)
+    timings[stage] = time.perf_counter() - start
+    return result
+
+
+def _analyze(path, duration, timings):
+    """分阶段分析音频，返回音频特征"""
+    if duration > STREAMING_MIN_DURATION:
+        analyzer = _timed(timings, 'stream_open', StreamingAudioAnalyzer, path)
+        envelope = _timed(timings, 'stream_onset_envelope', analyzer._get_onset_envelope)
+        _timed(timings, 'stream_tempo', analyzer._estimate_tempo, envelope)
+        # 包络已经缓存，这里包含再次估计速度、节拍跟踪和起始点检测
+        return _timed(timings, 'stream_extract_features', analyzer.extract_features)
+
+    analyzer = _timed(timings, 'decode', AudioAnalyzer, path)
+    _timed(timings, 'stft', analyzer._get_stft)
+    _timed(timings, 'spectrogram', analyzer._get_spectrogram)
+    envelope = _timed(timings, 'onset_envelope', analyzer._get_onset_envelope)
+    _timed(timings, 'beats', analyzer._extract_beats)
+    onset_frames = _timed(timings, 'onsets', analyzer._extract_onsets, envelope)
+    _timed(timings, 'intensities', analyzer._calculate_note_intensities, onset_frames)
+    _timed(timings, 'hpss', analyzer._separate_harmonic_percussive)
+    _timed(timings, 'pitch', analyzer._extract_pitch)
+    # 共享的频谱前端已经计算过，这里只包含节拍跟踪和各结果的组装
+    return _timed(timings, 'extract_features', analyzer.extract_features)
+
+
+def bench_case(path, duration, storage_dir):
+    """对一个音频文件测量流水线各阶段的耗时
+
+    Args:
+        path: 音频文件路径
+        duration: 音频时长(秒)
+        storage_dir: ChartStorage 使用的临时目录
+
+    Returns:
+        tuple: (各阶段耗时字典, 音符数)
+    """
+    timings = {}
+    features = _analyze(path, duration, timings)
+
+    chart = _timed(timings, 'generate_chart',
+                   ChartGenerator(features, 'hard', seed=0).generate_chart)
+    chart_data = _timed(timings, 'to_dict', chart.to_dict)
+    _timed(timings, 'from_dict', Chart.from_dict, chart_data)
+
+    # 不使用内存缓存，测量的是实际的磁盘读写和序列化
+    storage = ChartStorage(base_dir=storage_dir, memory_limit=0)
+    _timed(timings, 'storage_save', storage.save_chart, 'bench', chart_data, 'hard')
+    _timed(timings, 'storage_load', storage.load_chart, 'bench', 'hard')
+    _timed(timings, 'storage_load_binary', storage.load_chart_binary, 'bench', 'hard')
+    storage.delete_chart('bench')
+
+    return timings, len(chart)
+
+
+def run(cases, repeat=1):
+    """运行所有用例，每个阶段取多次运行中的最短耗时
+
+    Returns:
+        dict: 用例名称 -> {audio_seconds, notes, stages}
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as storage_dir:
+        for case, path, duration in cases:
+            best = {}
+            for _ in range(repeat):
+                timings, notes = bench_case(path, duration, storage_dir)
+                for stage, seconds in timings.items():
+                    best[stage] = min(seconds, best.get(stage, np.inf))
+            results[case] = {'audio_seconds': duration, 'notes': notes, 'stages': best}
+            total = sum(best.values())
+            print(f"{case:<20} {total:>8.2f} s  ({duration / total:>6.1f}x 实时, {notes} 个音符)")
+    return results
+
+
+def compare(results, baseline, max_regression, min_seconds):
+    """与基准结果比较，找出变慢超过阈值的阶段
+
+    Args:
+        results: 本次的结果
+        baseline: 基准结果
+        max_regression: 允许的最大变慢比例(0.25表示25%)
+        min_seconds: 绝对差值小于该值(秒)时不算退化，避免计时噪声
+
+    Returns:
+        list: (用例, 阶段, 基准耗时, 本次耗时) 列表
+    """
+    regressions = []
+    for case, result in results.items():
+        base_case = baseline.get(case)
+        if base_case is None:
+            continue
+        for stage, seconds in result['stages'].items():
+            base = base_case['stages'].get(stage)
+            if base is None:
+                continue
+            if seconds > base * (1 + max_regression) and seconds - base > min_seconds:
+                regressions.append((case, stage, base, seconds))
+    return regressions
+
+
+def print_table(results):
+    """按阶段打印耗时(毫秒)"""
+    stages = []
+    for result in results.values():
+        stages.extend(stage for stage in result['stages'] if stage not in stages)
+
+    print(f"\n{'stage':<24}" + ''.join(f"{case:>20}" for case in results))
+    for stage in stages:
+        row = ''.join(
+            f"{result['stages'][stage] * 1000:>20.1f}" if stage in result['stages'] else f"{'-':>20}"
+            for result in results.values()
+        )
+        print(f"{stage:<24}{row}")
+
+
+def environment_info():
+    """记录影响耗时的运行环境信息"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'librosa': librosa.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='谱面生成流水线的基准测试')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick', help='音频时长预设')
+    parser.add_argument('--durations', type=float, nargs='+', help='自定义音频时长(秒)，覆盖预设')
+    parser.add_argument('--cases', nargs='+', help='只运行名称包含这些字符串的用例')
+    parser.add_argument('--sr', type=int, default=44100, help='合成音频的采样率')
+    parser.add_argument('--repeat', type=int, default=1, help='每个用例的运行次数，取最短耗时')
+    parser.add_argument('--corpus-dir', help='保存合成音频的目录，默认使用临时目录')
+    parser.add_argument('--json', help='把结果写入JSON文件')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基准结果文件')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基准')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='允许的最大变慢比例，超过时以非零状态退出')
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help='绝对差值小于该值(秒)时不算退化')
+    args = parser.parse_args()
+
+    durations = args.durations or PRESETS[args.preset]
+    durations = [int(d) if float(d).is_integer() else d for d in durations]
+
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix='algorhythm-corpus-')
+    cases = build_corpus(corpus_dir, durations, sr=args.sr)
+    if args.cases:
+        cases = [case for case in cases if any(name in case[0] for name in args.cases)]
+
+    # 用一段短音频预热numba编译，避免第一个用例承担编译时间
+    warmup_path = os.path.join(corpus_dir, f"warmup_{args.sr}.wav")
+    if not os.path.exists(warmup_path):
+        make_corpus_audio(warmup_path, 'click', 120, 5, sr=args.sr)
+    AudioAnalyzer(warmup_path).extract_features()
+
+    results = run(cases, repeat=args.repeat)
+    print_table(results)
+
+    report = {'environment': environment_info(), 'results': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.corpus_dir is None:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n基准结果已保存到 {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n没有基准结果 {args.baseline}，跳过退化检查")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.max_regression, args.min_seconds)
+    if not regressions:
+        print(f"\n与基准相比没有超过 {args.max_regression:.0%} 的退化")
+        return 0
+
+    print(f"\n以下阶段比基准慢了超过 {args.max_regression:.0%}:")
+    for case, stage, base, seconds in regressions:
+        print(f"  {case:<20} {stage:<24} {base * 1000:>10.1f} ms -> {seconds * 1000:>10.1f} ms "
+              f"({seconds / base - 1:+.0%})")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
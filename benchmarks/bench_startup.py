@@ -0,0 +1,201 @@
+"""启动耗时的基准测试
+
+分别在全新的子进程中测量:
+- Web进程: import main 的耗时，以及导入后是否加载了 librosa/numba/scipy/soundfile 等重量级模块；
+- 分析进程: 进程初始化(warm_up_worker)和第一、第二个分析任务的耗时，分三种情况:
+  numba缓存为空且不预热(worker_cold)、缓存为空但预热(worker_warmup)、
+  缓存已经写好再预热(worker_cached，对应服务重启后的情况)。
+
+结果格式与 bench_pipeline 相同；Web进程加载了重量级模块，或者任何阶段比基准慢超过阈值时
+以非零状态退出。
+
+用法:
+    python -m benchmarks.bench_startup [--repeat 3] [--json 输出文件]
+        [--baseline 基准文件] [--save-baseline] [--max-regression 0.25] [--skip-worker]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_pipeline import compare, print_table
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baseline.json')
+
+# Web进程不应该在启动时加载的模块
+HEAVY_MODULES = ('librosa', 'numba', 'scipy', 'soundfile')
+
+# 分析进程的测量情况：(名称, 是否预热, 是否先写好numba缓存)
+WORKER_CASES = [
+    ('worker_cold', False, False),
+    ('worker_warmup', True, False),
+    ('worker_cached', True, True),
+]
+
+# 测量Web进程导入耗时的子进程代码
+WEB_PROBE = f"""
+import sys, json, time
+start = time.perf_counter()
+import main
+seconds = time.perf_counter() - start
+print(json.dumps({{'import_main': seconds,
+                  'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def probe_worker(task_seconds=10.0):
+    """在当前进程中模拟一个分析进程：初始化后连续执行两个分析任务(不使用特征缓存)
+
+    Args:
+        task_seconds: 分析任务的音频时长(秒)
+
+    Returns:
+        dict: 各阶段耗时(秒)
+    """
+    stages = {}
+    start = time.perf_counter()
+    from src.audio.warmup import warm_up_worker, make_warmup_signal
+    warm_up_worker()
+    stages['init'] = time.perf_counter() - start
+
+    import soundfile as sf
+    from src.audio.analyzer import create_analyzer
+    from src.chart.generator import ChartGenerator
+    from config import SAMPLE_RATE, DIFFICULTY_LEVELS
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'task.wav')
+        sf.write(path, make_warmup_signal(task_seconds, bpm=128), SAMPLE_RATE)
+        for stage in ('first_analysis', 'second_analysis'):
+            start = time.perf_counter()
+            features = create_analyzer(path).extract_features()
+            for difficulty in DIFFICULTY_LEVELS:
+                ChartGenerator(features, difficulty=difficulty, seed=0).generate_chart()
+            stages[stage] = time.perf_counter() - start
+    return stages
+
+
+def _run_probe(args, env=None):
+    """在全新的子进程中运行探测代码，返回其输出的最后一行JSON"""
+    output = subprocess.run(
+        [sys.executable] + args, cwd=ROOT, env=env, check=True,
+        stdout=subprocess.PIPE, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_web(repeat):
+    """测量Web进程的导入耗时，取最短值
+
+    Returns:
+        tuple: (结果, 导入时加载的重量级模块列表)
+    """
+    runs = [_run_probe(['-c', WEB_PROBE]) for _ in range(repeat)]
+    result = {'stages': {'import_main': min(run['import_main'] for run in runs)}}
+    return result, runs[0]['heavy']
+
+
+def bench_worker(warmup, primed):
+    """测量一种情况下分析进程的初始化和分析耗时
+
+    Args:
+        warmup: 是否预热
+        primed: 是否先用一个预热进程写好numba缓存
+
+    Returns:
+        dict: 结果
+    """
+    cache_dir = tempfile.mkdtemp(prefix='algorhythm-numba-')
+    env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir,
+               ALGORHYTHM_ANALYSIS_WARMUP='1' if warmup else '0')
+    try:
+        if primed:
+            _run_probe([os.path.abspath(__file__), '--probe-worker'], env=env)
+        stages = _run_probe([os.path.abspath(__file__), '--probe-worker'], env=env)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return {'stages': stages}
+
+
+def environment_info():
+    """记录影响耗时的运行环境信息"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动耗时的基准测试')
+    parser.add_argument('--repeat', type=int, default=3, help='Web进程导入的测量次数，取最短耗时')
+    parser.add_argument('--skip-worker', action='store_true', help='只测量Web进程')
+    parser.add_argument('--json', help='把结果写入JSON文件')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基准结果文件')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基准')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='允许的最大变慢比例，超过时以非零状态退出')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='绝对差值小于该值(秒)时不算退化')
+    parser.add_argument('--probe-worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe_worker:
+        print(json.dumps(probe_worker()))
+        return 0
+
+    results = {}
+    results['web'], heavy = bench_web(args.repeat)
+    print(f"web: import main {results['web']['stages']['import_main'] * 1000:.0f} ms")
+    if not args.skip_worker:
+        for name, warmup, primed in WORKER_CASES:
+            results[name] = bench_worker(warmup, primed)
+            stages = results[name]['stages']
+            print(f"{name}: " + ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in stages.items()))
+    print_table(results)
+
+    report = {'environment': environment_info(), 'results': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    status = 0
+    if heavy:
+        print(f"\nWeb进程启动时加载了重量级模块: {', '.join(heavy)}")
+        status = 1
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n基准结果已保存到 {args.baseline}")
+        return status
+
+    if not os.path.exists(args.baseline):
+        print(f"\n没有基准结果 {args.baseline}，跳过退化检查")
+        return status
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.max_regression, args.min_seconds)
+    if not regressions:
+        print(f"\n与基准相比没有超过 {args.max_regression:.0%} 的退化")
+        return status
+
+    print(f"\n以下阶段比基准慢了超过 {args.max_regression:.0%}:")
+    for case, stage, base, seconds in regressions:
+        print(f"  {case:<20} {stage:<24} {base * 1000:>10.1f} ms -> {seconds * 1000:>10.1f} ms "
+              f"({seconds / base - 1:+.0%})")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,10 +7,41 @@ SECRET_KEY = 'your-secret-key-here'
 UPLOAD_FOLDER = os.path.join('static', 'uploads')
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'ogg', 'flac'}
 
+# 分块上传配置(未完成的上传不放在static目录下，避免被直接访问)
+UPLOAD_PARTIAL_FOLDER = 'uploads_partial'
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 客户端每块上传的字节数
+UPLOAD_MAX_BYTES = int(os.environ.get('ALGORHYTHM_UPLOAD_MAX_BYTES', 2 * 1024 * 1024 * 1024))  # 分块上传的最大文件大小
+UPLOAD_PARTIAL_MAX_BYTES = int(os.environ.get('ALGORHYTHM_UPLOAD_PARTIAL_MAX_BYTES', 8 * 1024 * 1024 * 1024))  # 所有未完成上传声明大小的总和上限
+UPLOAD_PARTIAL_TTL = int(os.environ.get('ALGORHYTHM_UPLOAD_PARTIAL_TTL', 24 * 60 * 60))  # 超过该时间(秒)没有新数据的未完成上传会被清理
+
+# 播放音频配置: 这些无损格式的上传会转码为OGG Vorbis用于浏览器播放
+PLAYBACK_TRANSCODE_EXTENSIONS = {'wav', 'flac'}
+
 # 音频分析配置
 SAMPLE_RATE = 22050
 HOP_LENGTH = 512
 N_FFT = 2048
+# 解码后的重采样方式: 'soxr_hq', 'soxr_lq', 'polyphase', 'none'(见 src/audio/decode.py)
+DECODE_RESAMPLER = os.environ.get('ALGORHYTHM_RESAMPLER', 'soxr_hq')
+
+# 流式分析配置(用于超长音频，内存占用与时长无关)
+STREAMING_MIN_DURATION = 20 * 60  # 超过该时长(秒)的音频使用流式分析
+STREAM_BLOCK_FRAMES = 256  # 每次读取的分析帧数
+
+# 后台分析任务配置
+ANALYSIS_WORKERS = int(os.environ.get('ALGORHYTHM_ANALYSIS_WORKERS', 2))  # 分析进程数量
+JOB_QUEUE_SIZE = int(os.environ.get('ALGORHYTHM_JOB_QUEUE_SIZE', 16))     # 最多同时排队/运行的任务数
+JOB_RETENTION = 60 * 60  # 已完成任务的状态保留时间(秒)
+
+# 特征缓存配置(按音频内容哈希缓存分析结果和谱面)
+CACHE_FOLDER = 'cache'
+CACHE_MAX_BYTES = int(os.environ.get('ALGORHYTHM_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+CHART_CACHE_SIZE = 64  # 内存中保留的按需重建谱面数量
+CHART_MEMORY_CACHE_BYTES = int(os.environ.get('ALGORHYTHM_CHART_MEMORY_CACHE_BYTES', 64 * 1024 * 1024))  # 谱面存储的内存缓存上限
+
+# 分析进程启动配置
+NUMBA_CACHE_DIR = os.environ.get('NUMBA_CACHE_DIR', os.path.join(CACHE_FOLDER, 'numba'))  # librosa的numba编译结果缓存目录
+ANALYSIS_WARMUP = os.environ.get('ALGORHYTHM_ANALYSIS_WARMUP', '1') != '0'  # 分析进程启动时是否预热numba编译
 
 # 谱面生成配置
 NOTE_TYPES = ['tap', 'hold', 'slide']
@@ -1,14 +1,19 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, Response, send_file, g
 import os
 import uuid
 import json
+import time
 import numpy as np
-from src.utils.file_handler import save_uploaded_file, get_upload_path
+from src.utils.file_handler import save_uploaded_file, get_upload_path, safe_filename
+from src.utils.chunked_upload import ChunkedUploadManager, UploadError, UploadOffsetError, UploadQuotaError
 from src.utils.chart_storage import ChartStorage
-from src.audio.analyzer import AudioAnalyzer
-from src.chart.generator import ChartGenerator
+from src.utils.job_queue import JobQueue, JobQueueError
+from src.utils.pipeline import process_audio, regenerate_chart
+from src.audio.warmup import warm_up_worker
+from src.utils import metrics
+from src.chart.codec import CHART_BINARY_MIMETYPE
 from src.game.audio_manager import AudioManager
-from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, SECRET_KEY
+from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, SECRET_KEY, DIFFICULTY_LEVELS, UPLOAD_CHUNK_SIZE
 
 class NumpyJSONEncoder(json.JSONEncoder):
     """处理NumPy类型的JSON编码器"""
@@ -27,16 +32,108 @@ app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 限制上传文件大小
 app.secret_key = SECRET_KEY
 app.json_encoder = NumpyJSONEncoder
 
-# 初始化存储管理器
-chart_storage = ChartStorage()
+# 初始化存储管理器，只保存了引用的谱面按需重建
+chart_storage = ChartStorage(chart_resolver=regenerate_chart)
+
+# 初始化后台分析任务队列，分析进程启动时预热librosa的numba编译
+job_queue = JobQueue(initializer=warm_up_worker)
+
+# 初始化分块上传管理器，大文件分块上传并支持断点续传
+upload_manager = ChunkedUploadManager()
 
 # 确保上传文件夹存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+@app.before_request
+def prewarm_analysis_workers():
+    """收到第一个请求时在后台线程中启动并预热分析进程，不阻塞请求，也避免在导入时启动子进程"""
+    job_queue.prewarm(background=True)
+
+@app.before_request
+def start_request_timer():
+    """记录请求开始时间"""
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    """按路由模板记录请求耗时，避免每个会话ID产生一组新的标签"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, route=route,
+                                        method=request.method, status=response.status_code)
+    return response
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_difficulty(value):
+    """校验难度参数，不合法时使用会话中选择的难度"""
+    if value in DIFFICULTY_LEVELS:
+        return value
+    return session.get('difficulty', 'normal')
+
+def wants_json():
+    """判断客户端是否希望得到JSON响应"""
+    return request.accept_mimetypes.best == 'application/json'
+
+def start_analysis(session_id, filename, difficulty, audio_hash=None):
+    """提交后台分析任务，并在session中记录本次上传的信息
+    
+    Args:
+        session_id: 会话ID
+        filename: 保存后的文件名
+        difficulty: 选择的难度
+        audio_hash: 已知的音频内容哈希，None表示由分析进程计算
+        
+    Returns:
+        str: 任务ID
+        
+    Raises:
+        JobQueueError: 分析任务队列已满或分析进程不可用
+    """
+    # 不在请求线程中运行librosa
+    audio_path = get_upload_path(session_id, filename)
+    job_id = job_queue.submit(process_audio, audio_path, session_id, audio_hash,
+                              session_id=session_id)
+    
+    # 只在session中存储必要的信息
+    session['session_id'] = session_id
+    session['filename'] = filename
+    session['job_id'] = job_id
+    session['difficulty'] = difficulty if difficulty in DIFFICULTY_LEVELS else 'normal'
+    return job_id
+
+def chart_response(payload):
+    """发送谱面数据，支持预压缩的内容编码和ETag条件请求
+    
+    Args:
+        payload: ChartStorage.load_chart_payload 返回的谱面响应数据
+        
+    Returns:
+        Response: 谱面响应，客户端缓存有效时为304
+    """
+    # 不同内容编码的响应体不同，使用不同的强ETag
+    encoding = request.accept_encodings.best_match(list(payload.variants))
+    etag = f"{payload.etag}-{encoding}" if encoding else payload.etag
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(payload.variants[encoding] if encoding else payload.body,
+                            mimetype=payload.mimetype)
+        if encoding:
+            response.content_encoding = encoding
+    
+    response.set_etag(etag)
+    response.vary.update(['Accept', 'Accept-Encoding'])
+    response.cache_control.private = True
+    # 按引用生成的谱面在生成器升级后可能改变，完整保存的谱面也可能被批量生成原地覆盖，
+    # 同一URL的内容会变化，每次用ETag验证
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -60,27 +157,102 @@ def upload():
             
             # 保存文件
             filename = save_uploaded_file(file, session_id)
+            metrics.UPLOADS.inc(kind='form')
             
-            # 开始分析音频
-            audio_path = get_upload_path(session_id, filename)
-            analyzer = AudioAnalyzer(audio_path)
-            features = analyzer.extract_features()
-            
-            # 生成谱面
-            chart_generator = ChartGenerator(features)
-            chart = chart_generator.generate_chart()
-            
-            # 将谱面数据保存到文件
-            chart_storage.save_chart(session_id, chart.to_dict())
+            # 提交后台分析任务
+            try:
+                job_id = start_analysis(session_id, filename, request.form.get('difficulty', 'normal'))
+            except JobQueueError as e:
+                metrics.FAILURES.inc(operation='enqueue')
+                if wants_json():
+                    return jsonify({'error': str(e)}), 503
+                return render_template('upload.html', error=str(e), chunk_size=UPLOAD_CHUNK_SIZE), 503
             
-            # 只在session中存储必要的信息
-            session['session_id'] = session_id
-            session['filename'] = filename
-            # session['chart'] = chart.to_dict()
+            if wants_json():
+                return jsonify({'job_id': job_id, 'session_id': session_id}), 202
             
             return redirect(url_for('play'))
     
-    return render_template('upload.html')
+    return render_template('upload.html', chunk_size=UPLOAD_CHUNK_SIZE)
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """创建分块上传，返回上传ID和建议的块大小"""
+    payload = request.get_json(silent=True) or {}
+    filename = str(payload.get('filename', ''))
+    if not allowed_file(filename):
+        return jsonify({'error': '不支持的文件格式'}), 400
+    
+    try:
+        upload_id = upload_manager.create(filename, int(payload.get('size', 0)),
+                                          difficulty=get_difficulty(payload.get('difficulty')))
+    except UploadQuotaError as e:
+        metrics.FAILURES.inc(operation='upload')
+        return jsonify({'error': str(e)}), 503
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    session['upload_id'] = upload_id
+    return jsonify({'upload_id': upload_id, 'offset': 0, 'chunk_size': UPLOAD_CHUNK_SIZE}), 201
+
+@app.route('/api/uploads/<upload_id>')
+def get_upload(upload_id):
+    """查询分块上传的进度，断线重连后从返回的offset继续上传"""
+    try:
+        if session.get('upload_id') != upload_id:
+            raise KeyError(upload_id)
+        status = upload_manager.status(upload_id)
+    except KeyError:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'upload_id': upload_id, 'offset': status['offset'], 'size': status['size']})
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    """上传一个数据块，请求体为原始字节，Upload-Offset 头为该块的起始位置
+    
+    最后一块上传完成后直接提交分析任务，返回任务ID。
+    """
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Missing Upload-Offset header'}), 400
+    
+    try:
+        if session.get('upload_id') != upload_id:
+            raise KeyError(upload_id)
+        # 直接从请求流写入磁盘，不缓冲整个请求体
+        status = upload_manager.append(upload_id, offset, request.stream)
+    except KeyError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except UploadOffsetError as e:
+        return jsonify({'error': str(e), 'offset': e.expected}), 409
+    except UploadError as e:
+        metrics.FAILURES.inc(operation='upload')
+        return jsonify({'error': str(e)}), 400
+    
+    result = {'upload_id': upload_id, 'offset': status['offset'], 'size': status['size']}
+    if status['offset'] < status['size']:
+        return jsonify(result)
+    
+    # 上传完成，使用增量计算的哈希提交分析任务
+    session_id = str(uuid.uuid4())
+    filename = safe_filename(status['filename'])
+    audio_path = get_upload_path(session_id, filename)
+    try:
+        status = upload_manager.complete(upload_id, audio_path)
+    except KeyError:
+        # 同时到达的另一个最后一块请求已经完成了上传
+        return jsonify({'error': 'Upload not found'}), 404
+    try:
+        job_id = start_analysis(session_id, filename, status['difficulty'], status['audio_hash'])
+    except JobQueueError as e:
+        # 保留已上传的数据，客户端稍后以相同的offset重试即可
+        metrics.FAILURES.inc(operation='enqueue')
+        upload_manager.restore(upload_id, audio_path, status)
+        return jsonify(dict(result, error=str(e))), 503
+    
+    metrics.UPLOADS.inc(kind='chunked')
+    session.pop('upload_id', None)
+    return jsonify(dict(result, job_id=job_id, session_id=session_id)), 202
 
 @app.route('/play')
 def play():
@@ -90,29 +262,84 @@ def play():
     session_id = session['session_id']
     filename = session['filename']
     
-    # 检查谱面数据是否存在
-    chart_data = chart_storage.load_chart(session_id)
-    if chart_data is None:
-        return redirect(url_for('upload'))
+    job_id = session.get('job_id')
+    difficulty = get_difficulty(None)
     
-    # 获取音频文件路径
-    audio_path = get_upload_path(session_id, filename)
+    # 谱面可能仍在后台生成，只有任务和谱面都不存在时才返回上传页
+    if job_queue.get(job_id) is None and \
+            chart_storage.load_chart(session_id, difficulty) is None:
+        return redirect(url_for('upload'))
     
-    # 创建音频管理器
-    audio_manager = AudioManager(audio_path.replace('static/', ''))
+    # 创建音频管理器，音频通过 /audio 路由获取，转码完成后使用播放版本
+    audio_manager = AudioManager(get_upload_path(session_id, filename),
+                                 url=url_for('play_audio', session_id=session_id))
     
     return render_template('play.html', 
-                          audio_path=audio_path.replace('static/', ''),
                           session_id=session_id,
+                          job_id=job_id or '',
+                          difficulty=difficulty,
+                          difficulties=list(DIFFICULTY_LEVELS),
                           audio_data=audio_manager.to_dict())
 
+@app.route('/audio/<session_id>')
+def play_audio(session_id):
+    """发送游戏音频，优先使用转码后的播放版本，支持Range请求和条件请求"""
+    if session.get('session_id') != session_id:
+        return jsonify({'error': 'Audio not found'}), 404
+    
+    audio_manager = AudioManager(get_upload_path(session_id, session['filename']))
+    path = audio_manager.playback_path
+    if not os.path.exists(path):
+        return jsonify({'error': 'Audio not found'}), 404
+    
+    response = send_file(os.path.abspath(path), conditional=True)
+    response.accept_ranges = 'bytes'
+    response.cache_control.private = True
+    response.cache_control.public = False
+    if path != audio_manager.audio_path:
+        # 播放版本生成后不会改变
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = 365 * 24 * 60 * 60
+        response.cache_control.immutable = True
+    else:
+        # 播放版本可能还在生成，原始文件每次重新验证
+        response.cache_control.max_age = None
+        response.cache_control.no_cache = True
+    return response
+
 @app.route('/api/chart/<session_id>')
 def get_chart(session_id):
-    # 从文件加载谱面数据
-    chart_data = chart_storage.load_chart(session_id)
-    if chart_data is not None and session.get('session_id') == session_id:
-        return jsonify(chart_data)
-    return jsonify({'error': 'Chart not found'}), 404
+    # 所有难度的谱面在分析时一次性生成，切换难度只需读取对应文件
+    difficulty = get_difficulty(request.args.get('difficulty'))
+    if session.get('session_id') != session_id:
+        return jsonify({'error': 'Chart not found'}), 404
+    
+    # 客户端接受时返回紧凑的二进制谱面，否则返回JSON
+    mimetype = request.accept_mimetypes.best_match(['application/json', CHART_BINARY_MIMETYPE])
+    payload = chart_storage.load_chart_payload(session_id, difficulty,
+                                               binary=mimetype == CHART_BINARY_MIMETYPE)
+    if payload is None:
+        return jsonify({'error': 'Chart not found'}), 404
+    return chart_response(payload)
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """查询后台分析任务的状态和进度"""
+    status = job_queue.get(job_id)
+    if status is None or session.get('job_id') != job_id:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/wait')
+def wait_job(job_id):
+    """等待后台分析任务完成，最多等待timeout秒"""
+    if session.get('job_id') != job_id:
+        return jsonify({'error': 'Job not found'}), 404
+    timeout = min(request.args.get('timeout', 30, type=float), 60)
+    status = job_queue.wait(job_id, timeout=timeout)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
 
 @app.route('/api/start_game', methods=['POST'])
 def start_game():
@@ -122,21 +349,27 @@ def start_game():
         
     session_id = session['session_id']
     filename = session['filename']
+    payload = request.get_json(silent=True) or {}
+    difficulty = get_difficulty(payload.get('difficulty'))
     
-    # 加载谱面数据
-    chart_data = chart_storage.load_chart(session_id)
-    if chart_data is None:
+    # 加载已经序列化好的谱面数据，只需要未压缩的版本
+    chart_body = chart_storage.load_chart_body(session_id, difficulty)
+    if chart_body is None:
         return jsonify({'error': 'Chart not found'}), 404
         
-    # 获取音频路径
-    audio_path = get_upload_path(session_id, filename)
-    audio_manager = AudioManager(audio_path.replace('static/', ''))
+    # 获取音频信息
+    audio_manager = AudioManager(get_upload_path(session_id, filename),
+                                 url=url_for('play_audio', session_id=session_id))
     
-    # 返回游戏初始化数据
-    return jsonify({
-        'chart': chart_data,
-        'audio': audio_manager.to_dict()
-    })
+    # 返回游戏初始化数据，谱面部分直接拼接缓存的JSON，不重新序列化
+    audio_json = json.dumps(audio_manager.to_dict(), cls=NumpyJSONEncoder)
+    body = b'{"chart": ' + chart_body + b', "audio": ' + audio_json.encode('utf-8') + b'}'
+    return Response(body, mimetype='application/json')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """以Prometheus文本格式导出当前进程的运行指标"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
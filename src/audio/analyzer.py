@@ -1,33 +1,91 @@
 import librosa
 import numpy as np
+import soundfile as sf
+from src.audio.decode import decode_audio, frame_params
 from src.audio.features import AudioFeatures
-from config import SAMPLE_RATE, HOP_LENGTH, N_FFT
+from src.audio.streaming import StreamingAudioAnalyzer
+from src.utils.metrics import STAGE_SECONDS, FAILURES
+from config import DECODE_RESAMPLER, STREAMING_MIN_DURATION
 
 class AudioAnalyzer:
     """音频分析器，负责从音频文件中提取特征"""
     
-    def __init__(self, audio_path):
+    def __init__(self, audio_path, resampler=DECODE_RESAMPLER):
         """初始化分析器
         
         Args:
             audio_path: 音频文件路径
+            resampler: 解码后的重采样方式(见 src.audio.decode.RESAMPLERS)
         """
         self.audio_path = audio_path
+        self.resampler = resampler
         self.y = None
         self.sr = None
+        self.hop_length = None
+        self.n_fft = None
         self.duration = 0
+        
+        # 共享的频谱前端，首次使用时计算并缓存
+        self._stft = None
+        self._spectrogram = None
+        self._onset_envelope = None
+        
         self._load_audio()
     
     def _load_audio(self):
         """加载音频文件"""
         try:
-            self.y, self.sr = librosa.load(self.audio_path, sr=SAMPLE_RATE)
+            with STAGE_SECONDS.time(stage='decode'):
+                self.y, self.sr = decode_audio(self.audio_path, self.resampler)
+            self.hop_length, self.n_fft = frame_params(self.sr)
             self.duration = librosa.get_duration(y=self.y, sr=self.sr)
-            print(f"音频加载成功，时长: {self.duration:.2f}秒")
         except Exception as e:
+            FAILURES.inc(operation='decode')
             print(f"音频加载失败: {str(e)}")
             raise
     
+    def _get_stft(self):
+        """获取复数STFT矩阵，整首歌只计算一次
+        
+        Returns:
+            np.ndarray: 复数STFT矩阵 (1 + n_fft/2, 帧数)
+        """
+        if self._stft is None:
+            with STAGE_SECONDS.time(stage='stft'):
+                self._stft = librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length)
+        return self._stft
+    
+    def _get_spectrogram(self):
+        """获取幅度谱，由共享的STFT得到
+        
+        Returns:
+            np.ndarray: 幅度谱 (1 + n_fft/2, 帧数)
+        """
+        if self._spectrogram is None:
+            stft = self._get_stft()
+            with STAGE_SECONDS.time(stage='spectrogram'):
+                self._spectrogram = np.abs(stft)
+        return self._spectrogram
+    
+    def _get_onset_envelope(self):
+        """获取音符起始强度包络，由共享的幅度谱计算，整首歌只计算一次
+        
+        Returns:
+            np.ndarray: 音符起始强度序列
+        """
+        if self._onset_envelope is None:
+            spectrogram = self._get_spectrogram()
+            with STAGE_SECONDS.time(stage='onset_envelope'):
+                # 与 onset_strength(y=...) 相同：梅尔功率谱 -> 分贝 -> 谱通量
+                mel = librosa.feature.melspectrogram(
+                    S=spectrogram ** 2, sr=self.sr, n_fft=self.n_fft
+                )
+                self._onset_envelope = librosa.onset.onset_strength(
+                    S=librosa.power_to_db(mel), sr=self.sr,
+                    hop_length=self.hop_length, n_fft=self.n_fft
+                )
+        return self._onset_envelope
+    
     def extract_features(self):
         """提取音频特征
         
@@ -35,24 +93,35 @@ class AudioAnalyzer:
             AudioFeatures: 包含所有音频特征的对象
         """
         features = AudioFeatures()
+        features.duration = self.duration
         
-        # 1. 提取节拍信息
-        tempo, beats = self._extract_beats()
+        # 1. 提取节拍信息(先计算共享的起始强度包络，它单独记录耗时)
+        self._get_onset_envelope()
+        with STAGE_SECONDS.time(stage='beats'):
+            tempo, beats = self._extract_beats()
         features.tempo = tempo
         features.beats = beats
-        features.beat_times = librosa.frames_to_time(beats, sr=self.sr)
+        features.beat_times = librosa.frames_to_time(beats, sr=self.sr, hop_length=self.hop_length)
         
         # 2. 提取能量特征
         features.onset_strength = self._extract_onset_strength()
-        features.onset_frames = self._extract_onsets(features.onset_strength)
-        features.onset_times = librosa.frames_to_time(features.onset_frames, sr=self.sr)
+        with STAGE_SECONDS.time(stage='onsets'):
+            features.onset_frames = self._extract_onsets(features.onset_strength)
+        features.onset_times = librosa.frames_to_time(features.onset_frames, sr=self.sr,
+                                                      hop_length=self.hop_length)
         
-        # 3. 提取频谱和音高特征
-        features.harmonic, features.percussive = self._separate_harmonic_percussive()
-        features.pitches, features.magnitudes = self._extract_pitch()
+        # 3. 频谱和音高特征按需计算，只有真正读取时才进行分离和音高跟踪
+        features.register_extractor(('harmonic', 'percussive'), self._separate_harmonic_percussive)
+        features.register_extractor(('pitches', 'magnitudes'), self._extract_pitch)
         
         # 4. 计算每个音符的类型和难度
-        features.note_intensities = self._calculate_note_intensities(features.onset_frames)
+        with STAGE_SECONDS.time(stage='intensities'):
+            features.note_intensities = self._calculate_note_intensities(features.onset_frames)
+        
+        # 5. 注册的提取函数会让分析器一直存活，释放体积很大的STFT和幅度谱，
+        # 之后读取按需计算的字段时再重新计算
+        self._stft = None
+        self._spectrogram = None
         
         return features
     
@@ -62,8 +131,9 @@ class AudioAnalyzer:
         Returns:
             tuple: (tempo, beats) - 速度(BPM)和节拍帧位置
         """
-        onset_env = librosa.onset.onset_strength(y=self.y, sr=self.sr, hop_length=HOP_LENGTH)
-        tempo, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=self.sr)
+        tempo, beats = librosa.beat.beat_track(
+            onset_envelope=self._get_onset_envelope(), sr=self.sr, hop_length=self.hop_length
+        )
         return tempo, beats
     
     def _extract_onset_strength(self):
@@ -72,10 +142,7 @@ class AudioAnalyzer:
         Returns:
             np.ndarray: 音符起始强度序列
         """
-        onset_strength = librosa.onset.onset_strength(
-            y=self.y, sr=self.sr, hop_length=HOP_LENGTH
-        )
-        return onset_strength
+        return self._get_onset_envelope()
     
     def _extract_onsets(self, onset_strength):
         """提取音符起始帧位置
@@ -87,7 +154,7 @@ class AudioAnalyzer:
             np.ndarray: 音符起始帧位置
         """
         onsets = librosa.onset.onset_detect(
-            onset_envelope=onset_strength, sr=self.sr, hop_length=HOP_LENGTH
+            onset_envelope=onset_strength, sr=self.sr, hop_length=self.hop_length
         )
         return onsets
     
@@ -97,7 +164,15 @@ class AudioAnalyzer:
         Returns:
             tuple: (harmonic, percussive) - 和声部分和打击乐部分的波形
         """
-        harmonic, percussive = librosa.effects.hpss(self.y)
+        spectrogram = self._get_spectrogram()
+        stft = self._get_stft()
+        with STAGE_SECONDS.time(stage='hpss'):
+            # 在共享的幅度谱上计算分离掩码，再作用于共享的STFT并逆变换回波形
+            mask_harmonic, mask_percussive = librosa.decompose.hpss(spectrogram, mask=True)
+            harmonic = librosa.istft(stft * mask_harmonic, hop_length=self.hop_length,
+                                     n_fft=self.n_fft, dtype=self.y.dtype, length=len(self.y))
+            percussive = librosa.istft(stft * mask_percussive, hop_length=self.hop_length,
+                                       n_fft=self.n_fft, dtype=self.y.dtype, length=len(self.y))
         return harmonic, percussive
     
     def _extract_pitch(self):
@@ -106,9 +181,11 @@ class AudioAnalyzer:
         Returns:
             tuple: (pitches, magnitudes) - 音高和对应的强度
         """
-        pitches, magnitudes = librosa.piptrack(
-            y=self.y, sr=self.sr, hop_length=HOP_LENGTH, n_fft=N_FFT
-        )
+        spectrogram = self._get_spectrogram()
+        with STAGE_SECONDS.time(stage='pitch'):
+            pitches, magnitudes = librosa.piptrack(
+                S=spectrogram, sr=self.sr, hop_length=self.hop_length, n_fft=self.n_fft
+            )
         return pitches, magnitudes
     
     def _calculate_note_intensities(self, onset_frames):
@@ -124,8 +201,7 @@ class AudioAnalyzer:
             return np.array([])
             
         # 获取每个起始帧对应的能量值
-        onset_strength = self._extract_onset_strength()
-        intensities = onset_strength[onset_frames]
+        intensities = self._get_onset_envelope()[onset_frames]
         
         # 归一化到0-1之间
         if len(intensities) > 0:
@@ -134,4 +210,23 @@ class AudioAnalyzer:
             if max_val > min_val:
                 intensities = (intensities - min_val) / (max_val - min_val)
             
-        return intensities
\ No newline at end of file
+        return intensities
+
+def create_analyzer(audio_path):
+    """根据音频时长选择分析器，超长音频使用内存占用恒定的流式分析
+    
+    Args:
+        audio_path: 音频文件路径
+        
+    Returns:
+        AudioAnalyzer 或 StreamingAudioAnalyzer: 音频分析器
+    """
+    try:
+        duration = sf.info(audio_path).duration
+    except RuntimeError:
+        # soundfile无法读取的格式只能整体解码
+        return AudioAnalyzer(audio_path)
+    
+    if duration > STREAMING_MIN_DURATION:
+        return StreamingAudioAnalyzer(audio_path)
+    return AudioAnalyzer(audio_path)
@@ -0,0 +1,61 @@
+import librosa
+import numpy as np
+import soundfile as sf
+from config import SAMPLE_RATE, HOP_LENGTH, N_FFT
+
+# 可选的重采样方式
+#   soxr_hq:   高质量重采样(与 librosa.load 默认行为一致)
+#   soxr_lq:   低质量但更快的soxr重采样
+#   polyphase: 整数比例的多相滤波抽取(scipy.signal.resample_poly)
+#   none:      不重采样，按原始采样率缩放帧长和帧移
+RESAMPLERS = ('soxr_hq', 'soxr_lq', 'polyphase', 'none')
+
+
+def frame_params(sr):
+    """根据采样率缩放帧移和FFT长度，使分析帧率与 SAMPLE_RATE 下一致
+
+    Args:
+        sr: 采样率
+
+    Returns:
+        tuple: (hop_length, n_fft)
+    """
+    if sr == SAMPLE_RATE:
+        return HOP_LENGTH, N_FFT
+    scale = sr / SAMPLE_RATE
+    hop_length = int(round(HOP_LENGTH * scale))
+    n_fft = int(2 ** round(np.log2(N_FFT * scale)))
+    return hop_length, n_fft
+
+
+def decode_audio(audio_path, resampler='soxr_hq'):
+    """解码音频为单声道波形
+
+    优先用soundfile原生解码并混合为单声道，再按指定方式重采样；
+    soundfile不支持的格式回退到 librosa.load。
+
+    Args:
+        audio_path: 音频文件路径
+        resampler: 重采样方式，见 RESAMPLERS
+
+    Returns:
+        tuple: (y, sr) - 波形和采样率
+    """
+    if resampler not in RESAMPLERS:
+        raise ValueError(f"未知的重采样方式: {resampler}")
+
+    try:
+        y, sr = sf.read(audio_path, dtype='float32', always_2d=True)
+    except RuntimeError:
+        target_sr = None if resampler == 'none' else SAMPLE_RATE
+        res_type = 'soxr_hq' if resampler == 'none' else resampler
+        return librosa.load(audio_path, sr=target_sr, res_type=res_type)
+
+    # 混合为单声道
+    y = y.mean(axis=1) if y.shape[1] > 1 else y[:, 0]
+
+    if resampler == 'none' or sr == SAMPLE_RATE:
+        return y, sr
+
+    y = librosa.resample(y, orig_sr=sr, target_sr=SAMPLE_RATE, res_type=resampler)
+    return y, SAMPLE_RATE
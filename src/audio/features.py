@@ -1,9 +1,29 @@
 import numpy as np
 
+class FeatureUnavailableError(AttributeError):
+    """读取的按需计算字段既没有计算过，也没有注册提取函数时抛出
+    
+    例如从特征缓存加载的特征只包含谱面生成所需的字段，流式分析也不提供频谱类特征。
+    """
+
 class AudioFeatures:
-    """存储音频特征的数据结构"""
+    """存储音频特征的数据结构
+    
+    频谱类特征(和声/打击乐分离、音高)计算代价较高，采用按需计算：
+    分析器为这些字段注册提取函数，字段在第一次被读取时才计算并缓存。
+    """
+    
+    # 按需计算的字段，未注册提取函数时读取会抛出 FeatureUnavailableError
+    LAZY_FIELDS = ('harmonic', 'percussive', 'pitches', 'magnitudes')
+    
+    # 谱面生成所需的基础字段，用于持久化
+    CORE_FIELDS = ('duration', 'tempo', 'beats', 'beat_times', 'onset_strength',
+                   'onset_frames', 'onset_times', 'note_intensities')
     
     def __init__(self):
+        # 字段名 -> (同一提取函数产生的字段元组, 提取函数)
+        self._extractors = {}
+        
         # 基本信息
         self.duration = 0.0     # 音频时长(秒)
         
@@ -18,12 +38,99 @@ class AudioFeatures:
         self.onset_times = np.array([])     # 音符起始时间点(秒)
         self.note_intensities = np.array([])  # 每个音符的强度
         
-        # 频谱特征
-        self.harmonic = np.array([])        # 和声部分波形
-        self.percussive = np.array([])      # 打击乐部分波形
-        self.pitches = np.array([])         # 音高信息
-        self.magnitudes = np.array([])      # 音高强度
+        # 频谱特征(按需计算)
+        # harmonic: 和声部分波形
+        # percussive: 打击乐部分波形
+        # pitches: 音高信息
+        # magnitudes: 音高强度
+    
+    def register_extractor(self, fields, extractor):
+        """为按需计算的字段注册提取函数
+        
+        Args:
+            fields: 字段名元组，提取函数按相同顺序返回这些字段的值
+            extractor: 无参数的提取函数
+        """
+        fields = tuple(fields)
+        for field in fields:
+            self.__dict__.pop(field, None)
+            self._extractors[field] = (fields, extractor)
+    
+    def is_computed(self, field):
+        """判断字段是否已经计算
+        
+        Args:
+            field: 字段名
+            
+        Returns:
+            bool: 字段值是否已经存在
+        """
+        return field in self.__dict__
+    
+    def __getattr__(self, name):
+        """读取尚未计算的字段时调用注册的提取函数"""
+        if name.startswith('_'):
+            raise AttributeError(name)
+        
+        entry = self.__dict__.get('_extractors', {}).get(name)
+        if entry is None:
+            if name in self.LAZY_FIELDS:
+                # 不能返回空数组，否则使用它的调用方会悄悄地得到错误的结果
+                raise FeatureUnavailableError(
+                    f"特征 '{name}' 不可用：它没有被计算，也没有可用的提取函数"
+                    f"(例如特征来自缓存或流式分析)，需要重新分析音频"
+                )
+            raise AttributeError(f"'AudioFeatures' object has no attribute '{name}'")
+        
+        fields, extractor = entry
+        values = extractor()
+        if len(fields) == 1:
+            values = (values,)
+        
+        # 一次提取可能得到多个字段，全部缓存下来
+        for field, value in zip(fields, values):
+            self._extractors.pop(field, None)
+            setattr(self, field, value)
+        
+        return self.__dict__[name]
+    
+    def __getstate__(self):
+        """序列化时不包含提取函数(它们引用了整个分析器和音频数据)"""
+        state = self.__dict__.copy()
+        state['_extractors'] = {}
+        return state
 
+    def to_dict(self):
+        """转换为数组字典，用于持久化(只包含基础字段和已计算的频谱字段)
+        
+        Returns:
+            dict: 字段名到NumPy数组的映射
+        """
+        fields = self.CORE_FIELDS + tuple(
+            field for field in self.LAZY_FIELDS if self.is_computed(field)
+        )
+        return {field: np.asarray(getattr(self, field)) for field in fields}
+    
+    @classmethod
+    def from_dict(cls, data):
+        """从数组字典创建特征对象
+        
+        Args:
+            data: 字段名到数组的映射(例如np.load得到的NpzFile)
+            
+        Returns:
+            AudioFeatures: 特征对象
+        """
+        features = cls()
+        for field in cls.CORE_FIELDS + cls.LAZY_FIELDS:
+            if field in data:
+                setattr(features, field, np.asarray(data[field]))
+        
+        # 标量字段恢复为Python数值
+        features.duration = float(features.duration)
+        features.tempo = float(features.tempo)
+        return features
+    
     def get_beat_count(self):
         """获取节拍数量"""
         return len(self.beats)
@@ -0,0 +1,74 @@
+import os
+from src.utils.file_handler import write_atomic, link_atomic
+from src.utils.metrics import STAGE_SECONDS, FAILURES
+from config import PLAYBACK_TRANSCODE_EXTENSIONS
+
+# 播放版本文件名后缀，保存在原始文件旁边
+PLAYBACK_SUFFIX = '.playback.ogg'
+
+
+def playback_path(audio_path):
+    """获取音频播放版本的文件路径
+
+    Args:
+        audio_path: 原始音频文件路径
+
+    Returns:
+        str: 播放版本的文件路径(文件不一定存在)
+    """
+    return os.path.splitext(audio_path)[0] + PLAYBACK_SUFFIX
+
+
+def write_playback_rendition(audio_path, cached_path=None, block_frames=65536):
+    """把无损格式的音频转码为OGG Vorbis播放版本，减少浏览器需要下载的数据量
+
+    分块读取和编码，内存占用与音频时长无关；已经是有损压缩格式的音频不转码。
+    给出 cached_path 时，按内容缓存的播放版本存在就直接链接过来，不再解码；
+    否则转码后把结果链接到 cached_path 供之后的重复上传使用。
+
+    Args:
+        audio_path: 原始音频文件路径
+        cached_path: 按音频内容哈希缓存的播放版本路径，None表示不使用缓存
+        block_frames: 每次转码的采样帧数
+
+    Returns:
+        str: 播放版本的文件路径，不需要转码或无法转码时返回None
+    """
+    ext = os.path.splitext(audio_path)[1].lower().lstrip('.')
+    if ext not in PLAYBACK_TRANSCODE_EXTENSIONS:
+        return None
+
+    # 延迟导入，Web进程只需要 playback_path
+    import soundfile as sf
+
+    output_path = playback_path(audio_path)
+    if cached_path is not None:
+        try:
+            link_atomic(cached_path, output_path)
+            return output_path
+        except FileNotFoundError:
+            # 没有缓存，或者缓存条目刚好被淘汰
+            pass
+
+    try:
+        with STAGE_SECONDS.time(stage='transcode'), sf.SoundFile(audio_path) as source:
+            def write(f):
+                with sf.SoundFile(f, 'w', samplerate=source.samplerate, channels=source.channels,
+                                  format='OGG', subtype='VORBIS') as target:
+                    for block in source.blocks(block_frames, dtype='float32'):
+                        target.write(block)
+
+            write_atomic(output_path, write)
+    except RuntimeError as e:
+        # 无法转码时继续使用原始文件播放
+        FAILURES.inc(operation='transcode')
+        print(f"生成播放音频失败: {e}")
+        return None
+
+    if cached_path is not None:
+        try:
+            link_atomic(output_path, cached_path)
+        except OSError as e:
+            # 缓存写入失败不影响本次播放
+            print(f"缓存播放音频失败: {e}")
+    return output_path
@@ -0,0 +1,183 @@
+import librosa
+import numpy as np
+import soundfile as sf
+from src.audio.decode import frame_params
+from src.audio.features import AudioFeatures
+from src.utils.metrics import STAGE_SECONDS
+from config import STREAM_BLOCK_FRAMES
+
+# 速度估计使用的自相关窗口时长(秒)，与librosa默认值一致
+TEMPO_AC_SIZE = 8.0
+
+
+class StreamingAudioAnalyzer:
+    """流式音频分析器，按固定大小的块读取音频，内存占用与音频时长无关
+
+    只计算谱面生成需要的特征(起始强度包络、音符起始点、节拍)，
+    不会保存完整波形，因此和声/打击乐分离与音高特征不可用。
+    """
+
+    def __init__(self, audio_path, block_frames=STREAM_BLOCK_FRAMES):
+        """初始化分析器
+
+        Args:
+            audio_path: 音频文件路径
+            block_frames: 每个块包含的分析帧数
+        """
+        self.audio_path = audio_path
+        self.block_frames = block_frames
+
+        info = sf.info(audio_path)
+        self.sr = info.samplerate
+        self.duration = info.duration
+
+        # 不重采样，按原始采样率缩放帧长和帧移，使时间分辨率与常规模式一致
+        self.hop_length, self.n_fft = frame_params(self.sr)
+        self._onset_envelope = None
+
+    def _compute_onset_envelope(self):
+        """逐块计算音符起始强度包络
+
+        与 librosa.onset.onset_strength 的计算方式相同(梅尔谱 -> 分贝 -> 一阶正差分的均值)，
+        只是分贝的动态范围按已读取部分的最大值截断。
+
+        Returns:
+            np.ndarray: 音符起始强度序列
+        """
+        mel_basis = librosa.filters.mel(sr=self.sr, n_fft=self.n_fft)
+        blocks = librosa.stream(
+            self.audio_path,
+            block_length=self.block_frames,
+            frame_length=self.n_fft,
+            hop_length=self.hop_length,
+            mono=True,
+            fill_value=0
+        )
+
+        envelope = []
+        previous = None
+        max_db = -np.inf
+        for y_block in blocks:
+            stft = librosa.stft(y_block, n_fft=self.n_fft, hop_length=self.hop_length,
+                                center=False)
+            mel_db = librosa.power_to_db(mel_basis.dot(np.abs(stft) ** 2), top_db=None)
+
+            # 按目前为止的最大值截断动态范围(对应top_db=80)
+            max_db = max(max_db, float(mel_db.max()))
+            np.maximum(mel_db, max_db - 80.0, out=mel_db)
+
+            # 把上一块的最后一帧接在前面，保证块边界处的差分连续
+            if previous is not None:
+                mel_db = np.hstack([previous, mel_db])
+            flux = np.maximum(0.0, np.diff(mel_db, axis=1)).mean(axis=0)
+            envelope.append(flux.astype(np.float32))
+            previous = mel_db[:, -1:]
+
+        if not envelope:
+            return np.zeros(0, dtype=np.float32)
+
+        # 与常规模式的帧索引对齐：非居中分帧比居中分帧早n_fft/(2*hop)帧，
+        # librosa在居中模式下又会额外补n_fft/(2*hop)帧，再加上差分延迟的一帧
+        pad = 1 + 2 * (self.n_fft // (2 * self.hop_length))
+        envelope = np.concatenate([np.zeros(pad, dtype=np.float32)] + envelope)
+
+        # 去掉最后一块中由补零产生的多余帧
+        n_frames = 1 + int(round(self.duration * self.sr)) // self.hop_length
+        return envelope[:n_frames]
+
+    def _get_onset_envelope(self):
+        """获取音符起始强度包络，只计算一次"""
+        if self._onset_envelope is None:
+            # 流式模式下解码和起始强度计算是交错进行的，作为一个阶段记录
+            with STAGE_SECONDS.time(stage='stream_onset_envelope'):
+                self._onset_envelope = self._compute_onset_envelope()
+        return self._onset_envelope
+
+    def _estimate_tempo(self, onset_envelope):
+        """分块累加节奏图估计全曲速度
+
+        与 librosa.feature.tempo 的结果相同，但不会一次性构造 (窗口长度 x 帧数) 的完整节奏图。
+
+        Args:
+            onset_envelope: 音符起始强度序列
+
+        Returns:
+            float: 速度(BPM)
+        """
+        n = len(onset_envelope)
+        win_length = librosa.time_to_frames(TEMPO_AC_SIZE, sr=self.sr,
+                                            hop_length=self.hop_length).item()
+        window = librosa.filters.get_window('hann', win_length, fftbins=True)[:, np.newaxis]
+
+        # 与居中的tempogram相同的两端补齐方式
+        padded = np.pad(onset_envelope, win_length // 2, mode='linear_ramp', end_values=[0, 0])
+
+        total = np.zeros(win_length)
+        for start in range(0, n, self.block_frames):
+            end = min(start + self.block_frames, n)
+            frames = librosa.util.frame(padded[start:end + win_length - 1],
+                                        frame_length=win_length, hop_length=1)
+            autocorr = librosa.autocorrelate(frames * window, axis=0)
+            total += librosa.util.normalize(autocorr, norm=np.inf, axis=0).sum(axis=1)
+
+        tempo = librosa.feature.tempo(tg=(total / max(n, 1))[:, np.newaxis],
+                                      sr=self.sr, hop_length=self.hop_length)
+        return float(tempo[0])
+
+    def extract_features(self):
+        """提取音频特征
+
+        Returns:
+            AudioFeatures: 包含谱面生成所需特征的对象
+        """
+        features = AudioFeatures()
+        features.duration = self.duration
+
+        onset_envelope = self._get_onset_envelope()
+
+        # 1. 节拍信息(先分块估计速度，避免beat_track内部构造完整节奏图)
+        with STAGE_SECONDS.time(stage='tempo'):
+            bpm = self._estimate_tempo(onset_envelope)
+        with STAGE_SECONDS.time(stage='beats'):
+            tempo, beats = librosa.beat.beat_track(
+                onset_envelope=onset_envelope, sr=self.sr, hop_length=self.hop_length, bpm=bpm
+            )
+        features.tempo = tempo
+        features.beats = beats
+        features.beat_times = librosa.frames_to_time(beats, sr=self.sr,
+                                                     hop_length=self.hop_length)
+
+        # 2. 音符起始点
+        features.onset_strength = onset_envelope
+        with STAGE_SECONDS.time(stage='onsets'):
+            features.onset_frames = librosa.onset.onset_detect(
+                onset_envelope=onset_envelope, sr=self.sr, hop_length=self.hop_length
+            )
+        features.onset_times = librosa.frames_to_time(features.onset_frames, sr=self.sr,
+                                                      hop_length=self.hop_length)
+
+        # 3. 音符强度
+        with STAGE_SECONDS.time(stage='intensities'):
+            features.note_intensities = self._calculate_note_intensities(features.onset_frames)
+
+        return features
+
+    def _calculate_note_intensities(self, onset_frames):
+        """计算每个音符的强度
+
+        Args:
+            onset_frames: 音符起始帧位置
+
+        Returns:
+            np.ndarray: 每个音符的强度值(0-1之间)
+        """
+        if len(onset_frames) == 0:
+            return np.array([])
+
+        intensities = self._get_onset_envelope()[onset_frames]
+        min_val = np.min(intensities)
+        max_val = np.max(intensities)
+        if max_val > min_val:
+            intensities = (intensities - min_val) / (max_val - min_val)
+
+        return intensities
@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+import numpy as np
+from config import SAMPLE_RATE, NUMBA_CACHE_DIR, ANALYSIS_WARMUP
+
+
+def configure_numba_cache(cache_dir=NUMBA_CACHE_DIR):
+    """把numba编译结果缓存到指定目录
+
+    librosa 的numba函数使用磁盘缓存，默认写在安装目录的 __pycache__ 中，
+    线上环境通常不可写，每个新进程都要重新编译。必须在librosa加载这些函数之前调用。
+
+    Args:
+        cache_dir: 缓存目录，环境变量 NUMBA_CACHE_DIR 已设置时以环境变量为准
+    """
+    cache_dir = os.path.abspath(os.environ.setdefault('NUMBA_CACHE_DIR', os.path.abspath(cache_dir)))
+    os.makedirs(cache_dir, exist_ok=True)
+    numba = sys.modules.get('numba')
+    if numba is not None:
+        # numba已经导入时环境变量不再生效，之后定义的函数仍然读取这里的配置
+        numba.config.CACHE_DIR = cache_dir
+
+
+def make_warmup_signal(duration=3.0, sr=SAMPLE_RATE, bpm=120):
+    """生成用于预热的节拍音频，包含足够的起始点让节拍跟踪走完整个流程
+
+    Args:
+        duration: 时长(秒)
+        sr: 采样率
+        bpm: 速度
+
+    Returns:
+        np.ndarray: 单声道波形
+    """
+    t = np.arange(int(duration * sr)) / sr
+    phase = np.mod(t, 60.0 / bpm)
+    clicks = np.exp(-phase / 0.01) * np.sin(2 * np.pi * 1000.0 * t)
+    return (0.5 * clicks + 0.05 * np.sin(2 * np.pi * 220.0 * t)).astype(np.float32)
+
+
+def warm_up_analysis(duration=3.0):
+    """用一小段合成音频完整运行一次分析和谱面生成
+
+    librosa 的起始点检测、节拍跟踪和音高跟踪依赖numba编译的函数，
+    第一次调用时需要编译。在分析进程启动时预热，第一个真正的任务就不用承担编译时间。
+
+    Args:
+        duration: 预热音频的时长(秒)
+    """
+    # 延迟导入，只有真正预热的进程才加载librosa
+    import soundfile as sf
+    from src.audio.analyzer import AudioAnalyzer
+    from src.audio.streaming import StreamingAudioAnalyzer
+    from src.chart.generator import ChartGenerator
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'warmup.wav')
+        sf.write(path, make_warmup_signal(duration), SAMPLE_RATE)
+
+        features = AudioAnalyzer(path).extract_features()
+        features.pitches  # 音高跟踪是按需计算的，读取一次触发编译
+        StreamingAudioAnalyzer(path).extract_features()
+        ChartGenerator(features, 'hard', seed=0).generate_chart()
+
+
+def warm_up_worker():
+    """分析进程的初始化函数：配置numba磁盘缓存，并按配置预热分析流程
+
+    初始化函数抛出异常会让进程池损坏，重建后的进程池同样会失败。预热只是优化，
+    失败时记录错误后继续，进程照常执行分析任务。
+    """
+    try:
+        configure_numba_cache()
+        if ANALYSIS_WARMUP:
+            warm_up_analysis()
+    except Exception as e:
+        print(f"分析进程预热失败: {e}")
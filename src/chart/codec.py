@@ -0,0 +1,146 @@
+import struct
+import numpy as np
+from src.chart.models import Chart
+
+# 二进制谱面格式的MIME类型，/api/chart 根据 Accept 头选择
+CHART_BINARY_MIMETYPE = 'application/x-algorhythm-chart'
+
+# 二进制谱面格式 (所有整数为小端序，解码器见 static/js/game.js 中的 decodeBinaryChart):
+#
+#   头部  magic 'ARCH', 版本(u8), 难度名长度(u8), 时间量化单位(u16, 微秒),
+#         速度(f64), 时长(f64), 音符数量(u32), 时间段字节数(u32), 持续时间段字节数(u32)
+#   难度名        UTF-8
+#   轨道/类型     每个音符1字节，低4位为轨道，高4位为类型编码
+#   强度          每个音符1字节，强度 * 255
+#   时间          量化后相邻音符的时间差，varint
+#   持续时间      量化后的持续时间，varint
+#
+# 时间和持续时间量化到 TIME_UNIT 秒，远小于判定窗口(50毫秒)。
+CHART_MAGIC = b'ARCH'
+CHART_FORMAT_VERSION = 1
+TIME_UNIT_US = 1000
+TIME_UNIT = TIME_UNIT_US / 1e6
+
+_HEADER = struct.Struct('<4sBBHddIII')
+
+# varint每个字节保存7位，5个字节足够表示32位整数
+_VARINT_MAX_BYTES = 5
+
+
+def _encode_varints(values):
+    """把非负整数数组批量编码为varint字节串
+
+    Args:
+        values: 非负整数数组(小于2**35)
+
+    Returns:
+        bytes: 编码结果
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, _VARINT_MAX_BYTES):
+        sizes += values >= (1 << (7 * k))
+
+    out = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    offsets = np.cumsum(sizes) - sizes
+    for k in range(int(sizes.max(initial=0))):
+        has_byte = sizes > k
+        chunk = (values[has_byte] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        # 不是最后一个字节时设置最高位
+        chunk |= np.where(sizes[has_byte] > k + 1, 0x80, 0).astype(np.uint64)
+        out[offsets[has_byte] + k] = chunk
+    return out.tobytes()
+
+
+def _decode_varints(data, count):
+    """批量解码varint字节串
+
+    Args:
+        data: 字节串
+        count: 整数个数
+
+    Returns:
+        np.ndarray: int64数组
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(raw < 0x80)
+    if len(ends) != count:
+        raise ValueError('谱面数据损坏: varint数量不匹配')
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    # 每个字节在所属整数中的位置
+    position = np.arange(len(raw)) - np.repeat(starts, ends - starts + 1)
+    shifted = (raw & 0x7f).astype(np.int64) << (7 * position)
+    return np.add.reduceat(shifted, starts)
+
+
+def encode_chart(chart):
+    """把谱面编码为紧凑的二进制格式
+
+    Args:
+        chart: 谱面对象或谱面数据字典
+
+    Returns:
+        bytes: 二进制谱面
+    """
+    if isinstance(chart, dict):
+        chart = Chart.from_dict(chart)
+    columns = chart.columns()
+
+    # 先量化绝对时间再求差，避免误差累积
+    ticks = np.round(columns['time'] / TIME_UNIT).astype(np.int64)
+    deltas = np.diff(ticks, prepend=0)
+    if len(deltas) > 0 and deltas[0] < 0:
+        raise ValueError('二进制谱面不支持负的音符时间')
+    duration_ticks = np.round(np.maximum(columns['duration'], 0) / TIME_UNIT).astype(np.int64)
+
+    lane_types = (columns['lane'].astype(np.uint8) & 0x0f) | (columns['type_code'].astype(np.uint8) << 4)
+    intensities = np.round(np.clip(columns['intensity'], 0, 1) * 255).astype(np.uint8)
+    times_bytes = _encode_varints(deltas)
+    durations_bytes = _encode_varints(duration_ticks)
+    difficulty = chart.difficulty.encode('utf-8')
+
+    header = _HEADER.pack(CHART_MAGIC, CHART_FORMAT_VERSION, len(difficulty), TIME_UNIT_US,
+                          float(chart.tempo), float(chart.duration), len(ticks),
+                          len(times_bytes), len(durations_bytes))
+    return b''.join([header, difficulty, lane_types.tobytes(), intensities.tobytes(),
+                     times_bytes, durations_bytes])
+
+
+def decode_chart(data):
+    """解码二进制谱面
+
+    Args:
+        data: 二进制谱面
+
+    Returns:
+        Chart: 谱面对象(时间和持续时间精确到量化单位)
+    """
+    magic, version, difficulty_len, time_unit_us, tempo, duration, count, times_len, durations_len = \
+        _HEADER.unpack_from(data)
+    if magic != CHART_MAGIC or version != CHART_FORMAT_VERSION:
+        raise ValueError('不支持的谱面格式')
+
+    offset = _HEADER.size
+    difficulty = bytes(data[offset:offset + difficulty_len]).decode('utf-8')
+    offset += difficulty_len
+    lane_types = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset)
+    offset += count
+    intensities = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset)
+    offset += count
+    deltas = _decode_varints(data[offset:offset + times_len], count)
+    offset += times_len
+    duration_ticks = _decode_varints(data[offset:offset + durations_len], count)
+
+    time_unit = time_unit_us / 1e6
+    chart = Chart(tempo=tempo, duration=duration, difficulty=difficulty)
+    chart.add_notes(
+        times=np.cumsum(deltas) * time_unit,
+        lanes=lane_types & 0x0f,
+        type_codes=lane_types >> 4,
+        durations=duration_ticks * time_unit,
+        intensities=intensities / 255.0
+    )
+    return chart
@@ -1,23 +1,31 @@
 import numpy as np
-import random
-from src.chart.models import Chart, Note
-from config import DIFFICULTY_LEVELS, LANES
+from src.chart.models import Chart
+from src.chart.lanes import LaneOccupancy
+from config import DIFFICULTY_LEVELS, LANES, NOTE_TYPES
+
+# 谱面生成算法版本，生成逻辑或随机数的使用顺序改变时必须加1，
+# 保证 (特征哈希, 难度, 种子, 版本) 能唯一确定一张谱面
+GENERATOR_VERSION = 1
 
 class ChartGenerator:
     """谱面生成器，负责将音频特征转换为音游谱面"""
     
-    def __init__(self, audio_features, difficulty='normal'):
+    def __init__(self, audio_features, difficulty='normal', seed=None):
         """初始化谱面生成器
         
         Args:
             audio_features: 音频特征对象
             difficulty: 难度级别 ('easy', 'normal', 'hard')
+            seed: 随机种子，相同的特征、难度和种子总是生成相同的谱面；None表示随机
         """
         self.features = audio_features
         self.difficulty = difficulty
         self.difficulty_config = DIFFICULTY_LEVELS[difficulty]
         self.lanes = LANES
-        self.notes = []
+        self.notes = self._empty_notes()
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.occupancy = LaneOccupancy(self.lanes)
     
     def generate_chart(self):
         """生成音游谱面
@@ -30,168 +38,188 @@ class ChartGenerator:
                      duration=self.features.duration,
                      difficulty=self.difficulty)
         
-        # 分配音符到轨道
-        self._assign_notes_to_lanes()
+        # 每次生成都从种子重新开始，保证结果可复现
+        self.rng = np.random.default_rng(self.seed)
         
-        # 添加音符到谱面
-        for note in self.notes:
-            chart.add_note(note)
+        # 分配音符到轨道，并批量添加到谱面
+        self._assign_notes_to_lanes()
+        chart.add_notes(**self.notes)
             
         return chart
     
     def _assign_notes_to_lanes(self):
-        """将音符分配到不同轨道"""
-        if len(self.features.onset_times) == 0:
-            return
+        """将音符分配到不同轨道
         
-        # 清空原有的音符列表
-        self.notes = []
+        音符数量、类型和持续时间对所有起始点批量计算，只有轨道选择依赖之前的音符，按时间顺序逐个处理。
+        结果以列的形式保存在 self.notes 中(见 Chart.add_notes 的参数)。
+        """
+        # 清空原有的音符和轨道占用状态
+        self.notes = self._empty_notes()
+        self.occupancy.reset()
         
-        # 处理每个检测到的音符起始点
-        for i, time in enumerate(self.features.onset_times):
-            # 获取音符强度，用于决定音符类型和轨道
-            intensity = self.features.note_intensities[i] if i < len(self.features.note_intensities) else 0.5
-            
-            # 决定在这个时间点放置多少个音符 (基于难度)
-            num_notes = self._decide_note_count(intensity)
-            
-            # 选择要使用的轨道
-            lanes = self._select_lanes(num_notes, time)
-            
-            # 为每个选中的轨道创建音符
-            for lane in lanes:
-                note_type = self._decide_note_type(intensity)
-                duration = self._decide_note_duration(note_type, time)
-                
-                note = Note(
-                    time=time,
-                    lane=lane,
-                    type=note_type,
-                    duration=duration,
-                    intensity=intensity
-                )
-                self.notes.append(note)
+        onset_times = np.asarray(self.features.onset_times, dtype=float)
+        if len(onset_times) == 0:
+            return
+        
+        # 获取音符强度，用于决定音符类型和轨道(缺失的强度按0.5处理)
+        intensities = np.full(len(onset_times), 0.5)
+        known = np.asarray(self.features.note_intensities, dtype=float)[:len(onset_times)]
+        intensities[:len(known)] = known
+        
+        # 决定每个时间点放置多少个音符 (基于难度)
+        counts = self._decide_note_counts(intensities)
+        
+        # 展开为每个音符一行，批量决定类型和持续时间
+        onset_index = np.repeat(np.arange(len(onset_times)), counts)
+        note_times = onset_times[onset_index]
+        note_intensities = intensities[onset_index]
+        type_codes = self._decide_note_types(note_intensities)
+        durations = self._decide_note_durations(type_codes, note_times)
+        
+        # 每个时间点每条轨道的随机优先级，取优先级最小的轨道即为均匀随机选择
+        lane_keys = self.rng.random((len(onset_times), self.lanes))
+        
+        # 按时间顺序选择轨道，空闲轨道不够而没有放置的音符轨道保持为-1
+        note_lanes = np.full(len(note_times), -1)
+        end = 0
+        for i, time in enumerate(onset_times):
+            start, end = end, end + counts[i]
+            lanes = self._select_lanes(counts[i], time, lane_keys[i])
+            for j, lane in zip(range(start, end), lanes):
+                self.occupancy.occupy(lane, time, durations[j])
+                note_lanes[j] = lane
+        
+        placed = note_lanes >= 0
+        self.notes = {
+            'times': note_times[placed],
+            'lanes': note_lanes[placed],
+            'type_codes': type_codes[placed],
+            'durations': durations[placed],
+            'intensities': note_intensities[placed]
+        }
+    
+    def _empty_notes(self):
+        """没有音符时的列数据"""
+        return {
+            'times': np.zeros(0),
+            'lanes': np.zeros(0, dtype=int),
+            'type_codes': np.zeros(0, dtype=int),
+            'durations': np.zeros(0),
+            'intensities': np.zeros(0)
+        }
     
-    def _decide_note_count(self, intensity):
-        """决定在一个时间点放置多少个音符
+    def _decide_note_counts(self, intensities):
+        """批量决定每个时间点放置多少个音符
+        
+        放置1个音符的概率为 1 - 0.7 * 强度，其余数量平分剩下的概率。
         
         Args:
-            intensity: 音符强度 (0-1)
+            intensities: 每个时间点的音符强度数组 (0-1)
             
         Returns:
-            int: 音符数量
+            np.ndarray: 每个时间点的音符数量
         """
-        max_notes = self.difficulty_config['max_notes_per_beat']
+        max_notes = min(self.difficulty_config['max_notes_per_beat'], self.lanes)
+        if max_notes <= 1:
+            return np.ones(len(intensities), dtype=int)
         
         # 音符强度越高，放置的音符越多
-        prob_distribution = []
-        for i in range(1, max_notes + 1):
-            # 难度越高，多音符的概率越大
-            if i == 1:
-                prob_distribution.append(1.0 - intensity * 0.7)
-            else:
-                prob_distribution.append(intensity * 0.7 / (max_notes - 1))
-                
-        # 按概率分布随机选择音符数量
-        return np.random.choice(range(1, max_notes + 1), p=prob_distribution)
+        single_prob = 1.0 - intensities * 0.7
+        u = self.rng.random(len(intensities))
+        multi = u >= single_prob
+        
+        # 落在多音符区间时，在2..max_notes中均匀选择
+        extra_prob = np.where(multi, 1.0 - single_prob, 1.0)
+        position = np.where(multi, (u - single_prob) / extra_prob, 0.0)
+        extra = np.minimum((position * (max_notes - 1)).astype(int), max_notes - 2)
+        
+        return np.where(multi, 2 + extra, 1)
     
-    def _select_lanes(self, num_notes, time):
+    def _select_lanes(self, num_notes, time, lane_keys):
         """选择要使用的轨道
         
+        正在被长按/滑动音符占用的轨道不会被选择；如果空闲轨道不够，实际放置的音符数会减少。
+        
         Args:
             num_notes: 音符数量
             time: 音符时间
+            lane_keys: 每条轨道的随机优先级
             
         Returns:
-            list: 选中的轨道索引列表
+            np.ndarray: 选中的轨道索引数组(长度可能小于num_notes)
         """
-        available_lanes = list(range(self.lanes))
-        
-        # 避免选择到最近使用过的轨道
-        recent_used_lanes = []
-        time_threshold = 0.3  # 300毫秒内认为是最近使用的轨道
-        
-        for note in self.notes:
-            if abs(note.time - time) < time_threshold:
-                recent_used_lanes.append(note.lane)
-        
-        # 优先选择未使用的轨道
-        preferred_lanes = [lane for lane in available_lanes if lane not in recent_used_lanes]
-        
-        if len(preferred_lanes) >= num_notes:
-            return random.sample(preferred_lanes, num_notes)
-        else:
-            # 如果可用轨道不够，从所有轨道中随机选择
-            return random.sample(available_lanes, num_notes)
+        # 优先选择空闲且300毫秒内没有使用过的轨道
+        preferred = self.occupancy.preferred_mask(time)
+        if np.count_nonzero(preferred) >= num_notes:
+            return np.argsort(np.where(preferred, lane_keys, np.inf))[:num_notes]
+        
+        # 如果优先轨道不够，从所有空闲轨道中随机选择
+        free = self.occupancy.free_mask(time)
+        num_notes = min(num_notes, np.count_nonzero(free))
+        return np.argsort(np.where(free, lane_keys, np.inf))[:num_notes]
     
-    def _decide_note_type(self, intensity):
-        """决定音符类型
+    def _decide_note_types(self, intensities):
+        """批量决定音符类型
         
         Args:
-            intensity: 音符强度 (0-1)
+            intensities: 每个音符的强度数组 (0-1)
             
         Returns:
-            str: 音符类型 ('tap', 'hold', 'slide')
+            np.ndarray: 音符类型在 NOTE_TYPES 中的索引 (0: tap, 1: hold, 2: slide)
         """
         # 根据难度配置决定不同类型音符的概率
-        hold_prob = self.difficulty_config['hold_note_prob']
-        slide_prob = self.difficulty_config['slide_note_prob']
+        hold_prob = np.full(len(intensities), self.difficulty_config['hold_note_prob'])
+        slide_prob = np.full(len(intensities), self.difficulty_config['slide_note_prob'])
         tap_prob = 1.0 - hold_prob - slide_prob
         
         # 音符强度会影响类型选择
-        if intensity > 0.8:
-            # 强音符更可能是滑动或长按
-            hold_prob *= 1.5
-            slide_prob *= 1.5
-        elif intensity < 0.3:
-            # 弱音符更可能是单击
-            tap_prob *= 1.5
-            
+        # 强音符更可能是滑动或长按
+        strong = intensities > 0.8
+        hold_prob[strong] *= 1.5
+        slide_prob[strong] *= 1.5
+        # 弱音符更可能是单击
+        tap_prob[intensities < 0.3] *= 1.5
+        
         # 重新归一化概率
         total = tap_prob + hold_prob + slide_prob
         tap_prob /= total
         hold_prob /= total
-        slide_prob /= total
         
         # 按概率随机选择类型
-        rand = random.random()
-        if rand < tap_prob:
-            return 'tap'
-        elif rand < tap_prob + hold_prob:
-            return 'hold'
-        else:
-            return 'slide'
+        u = self.rng.random(len(intensities))
+        return (u >= tap_prob).astype(int) + (u >= tap_prob + hold_prob)
     
-    def _decide_note_duration(self, note_type, start_time):
-        """决定音符持续时间
+    def _decide_note_durations(self, type_codes, start_times):
+        """批量决定音符持续时间
         
         Args:
-            note_type: 音符类型
-            start_time: 音符开始时间
+            type_codes: 音符类型索引数组
+            start_times: 音符开始时间数组
             
         Returns:
-            float: 音符持续时间 (秒)
+            np.ndarray: 音符持续时间数组 (秒)
         """
-        if note_type == 'tap':
-            return 0.0  # 单击音符没有持续时间
-            
-        # 寻找下一个节拍或音符
-        next_beat_time = None
-        for beat_time in self.features.beat_times:
-            if beat_time > start_time + 0.1:  # 至少持续0.1秒
-                next_beat_time = beat_time
-                break
-                
-        if next_beat_time is None:
-            # 如果没有找到下一个节拍，使用默认持续时间
-            return random.uniform(0.2, 0.5)
-        
-        # 根据音符类型调整持续时间
-        if note_type == 'hold':
-            # 长按音符持续到下一个节拍
-            return next_beat_time - start_time
-        elif note_type == 'slide':
-            # 滑动音符持续时间略短
-            return (next_beat_time - start_time) * 0.8
-        
-        return 0.0
\ No newline at end of file
+        durations = np.zeros(len(start_times))
+        
+        # 单击音符没有持续时间
+        is_long = type_codes != NOTE_TYPES.index('tap')
+        if not np.any(is_long):
+            return durations
+        
+        # 寻找下一个节拍 (至少持续0.1秒)
+        beat_times = np.asarray(self.features.beat_times, dtype=float)
+        next_idx = np.searchsorted(beat_times, start_times + 0.1, side='right')
+        has_next = next_idx < len(beat_times)
+        next_beat_time = beat_times[np.minimum(next_idx, max(len(beat_times) - 1, 0))] \
+            if len(beat_times) > 0 else np.zeros(len(start_times))
+        to_next_beat = next_beat_time - start_times
+        
+        # 长按音符持续到下一个节拍，滑动音符持续时间略短
+        is_slide = type_codes == NOTE_TYPES.index('slide')
+        beat_durations = np.where(is_slide, to_next_beat * 0.8, to_next_beat)
+        
+        # 如果没有找到下一个节拍，使用默认持续时间
+        default_durations = self.rng.uniform(0.2, 0.5, len(start_times))
+        
+        durations[is_long] = np.where(has_next, beat_durations, default_durations)[is_long]
+        return durations
@@ -0,0 +1,60 @@
+import numpy as np
+
+
+class LaneOccupancy:
+    """轨道占用状态，用于谱面生成时的轨道选择
+
+    每条轨道记录最近一次放置音符的时间和被长按/滑动音符占用到的时间，
+    查询某个时间点的可用轨道只需要 O(轨道数) 的向量运算，与已生成的音符数量无关。
+    """
+
+    def __init__(self, lanes, recent_window=0.3):
+        """初始化轨道占用状态
+
+        Args:
+            lanes: 轨道数量
+            recent_window: 在该时间(秒)内放置过音符的轨道视为最近使用过
+        """
+        self.lanes = lanes
+        self.recent_window = recent_window
+        self.last_hit = np.full(lanes, -np.inf)
+        self.busy_until = np.full(lanes, -np.inf)
+
+    def free_mask(self, time):
+        """获取没有被长音符占用的轨道
+
+        Args:
+            time: 时间点(秒)
+
+        Returns:
+            np.ndarray: 布尔数组，True表示该轨道空闲
+        """
+        return self.busy_until <= time
+
+    def preferred_mask(self, time):
+        """获取空闲且最近没有放置过音符的轨道
+
+        Args:
+            time: 时间点(秒)
+
+        Returns:
+            np.ndarray: 布尔数组，True表示优先选择该轨道
+        """
+        return self.free_mask(time) & (time - self.last_hit >= self.recent_window)
+
+    def occupy(self, lane, time, duration=0.0):
+        """记录在某条轨道上放置了音符
+
+        Args:
+            lane: 轨道索引
+            time: 音符时间(秒)
+            duration: 音符持续时间(秒)，长按和滑动音符在此期间占用轨道
+        """
+        self.last_hit[lane] = time
+        if duration > 0:
+            self.busy_until[lane] = max(self.busy_until[lane], time + duration)
+
+    def reset(self):
+        """清空所有轨道的占用状态"""
+        self.last_hit.fill(-np.inf)
+        self.busy_until.fill(-np.inf)
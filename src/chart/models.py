@@ -1,5 +1,20 @@
+import numpy as np
+from config import NOTE_TYPES
+
+# 音符类型名称到类型编码(NOTE_TYPES中的索引)的映射
+NOTE_TYPE_CODES = {name: code for code, name in enumerate(NOTE_TYPES)}
+# 类型编码到名称的查找表，按编码数组索引即可批量得到名称
+NOTE_TYPE_NAMES = np.array(NOTE_TYPES, dtype=object)
+
+
 class Note:
-    """音符类，表示谱面中的一个音符"""
+    """音符类，表示谱面中的一个音符
+    
+    谱面内部按列存储音符，Note 只是一行数据的轻量记录，使用 __slots__ 避免每个对象的 __dict__。
+    从谱面取出的 Note 是数据的副本，修改它不会影响谱面。
+    """
+    
+    __slots__ = ('time', 'lane', 'type', 'duration', 'intensity')
     
     def __init__(self, time, lane, type='tap', duration=0.0, intensity=0.5):
         """初始化音符
@@ -33,7 +48,7 @@ class Note:
         
         Args:
             data: 字典数据
-            
+        
         Returns:
             Note: 音符对象
         """
@@ -47,7 +62,11 @@ class Note:
 
 
 class Chart:
-    """谱面类，包含一个完整的音游关卡"""
+    """谱面类，包含一个完整的音游关卡
+    
+    音符按列存储为 NumPy 数组(时间、轨道、类型编码、持续时间、强度)，并始终按时间排序，
+    时间范围查询使用二分查找。逐个添加的音符先放在缓冲区，读取时再合并排序。
+    """
     
     def __init__(self, tempo=120.0, duration=0.0, difficulty='normal'):
         """初始化谱面
@@ -60,7 +79,18 @@ class Chart:
         self.tempo = tempo
         self.duration = duration
         self.difficulty = difficulty
-        self.notes = []
+        self._times = np.zeros(0)
+        self._lanes = np.zeros(0, dtype=np.int8)
+        self._type_codes = np.zeros(0, dtype=np.int8)
+        self._durations = np.zeros(0)
+        self._intensities = np.zeros(0)
+        self._pending = []    # add_note 添加、尚未合并到数组的音符
+        self._notes = None    # 按需创建的 Note 元组
+    
+    def __len__(self):
+        """音符数量"""
+        self._flush()
+        return len(self._times)
     
     def add_note(self, note):
         """添加音符到谱面
@@ -68,31 +98,137 @@ class Chart:
         Args:
             note: 要添加的音符对象
         """
-        self.notes.append(note)
+        self._pending.append((note.time, note.lane, NOTE_TYPE_CODES[note.type],
+                              note.duration, note.intensity))
+        self._notes = None
+    
+    def add_notes(self, times, lanes, type_codes, durations=None, intensities=None):
+        """批量添加音符
+        
+        Args:
+            times: 音符时间数组(秒)
+            lanes: 轨道索引数组
+            type_codes: 音符类型编码数组(NOTE_TYPES中的索引)
+            durations: 持续时间数组(秒)，默认为0
+            intensities: 强度数组(0-1)，默认为0.5
+        """
+        times = np.asarray(times, dtype=float)
+        if durations is None:
+            durations = np.zeros(len(times))
+        if intensities is None:
+            intensities = np.full(len(times), 0.5)
+        
+        self._flush()
+        self._set_columns(
+            np.concatenate([self._times, times]),
+            np.concatenate([self._lanes, np.asarray(lanes, dtype=np.int8)]),
+            np.concatenate([self._type_codes, np.asarray(type_codes, dtype=np.int8)]),
+            np.concatenate([self._durations, np.asarray(durations, dtype=float)]),
+            np.concatenate([self._intensities, np.asarray(intensities, dtype=float)])
+        )
+    
+    def _set_columns(self, times, lanes, type_codes, durations, intensities):
+        """设置音符列并按时间稳定排序(同一时间的音符保持添加顺序)"""
+        if len(times) > 1 and np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind='stable')
+            times, lanes, type_codes = times[order], lanes[order], type_codes[order]
+            durations, intensities = durations[order], intensities[order]
+        self._times = times
+        self._lanes = lanes
+        self._type_codes = type_codes
+        self._durations = durations
+        self._intensities = intensities
+        self._notes = None
+    
+    def _flush(self):
+        """把缓冲区中的音符合并到列数组"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        times, lanes, type_codes, durations, intensities = zip(*pending)
+        self.add_notes(times, lanes, type_codes, durations, intensities)
+    
+    @property
+    def times(self):
+        """按时间排序的音符时间数组"""
+        self._flush()
+        return self._times
+    
+    def columns(self):
+        """获取音符的列数据
+        
+        Returns:
+            dict: time, lane, type_code, duration, intensity 五个等长数组
+        """
+        self._flush()
+        return {
+            'time': self._times,
+            'lane': self._lanes,
+            'type_code': self._type_codes,
+            'duration': self._durations,
+            'intensity': self._intensities
+        }
+    
+    @property
+    def notes(self):
+        """按时间排序的音符元组，首次访问时从列数据创建并缓存
+        
+        返回只读的元组，添加音符需要使用 add_note/add_notes。
+        """
+        self._flush()
+        if self._notes is None:
+            self._notes = tuple(
+                Note(time, lane, name, duration, intensity)
+                for time, lane, name, duration, intensity in zip(
+                    self._times.tolist(), self._lanes.tolist(),
+                    NOTE_TYPE_NAMES[self._type_codes].tolist(),
+                    self._durations.tolist(), self._intensities.tolist())
+            )
+        return self._notes
     
     def get_notes_in_time_range(self, start_time, end_time):
-        """获取指定时间范围内的音符
+        """获取指定时间范围内的音符，复杂度O(log n + k)
         
         Args:
             start_time: 开始时间(秒)
             end_time: 结束时间(秒)
-            
+        
         Returns:
             list: 该时间范围内的音符列表
         """
-        return [note for note in self.notes if start_time <= note.time < end_time]
+        start, end = np.searchsorted(self.times, [start_time, end_time], side='left')
+        return list(self.notes[start:max(start, end)])
     
     def sort_notes(self):
-        """按时间对音符进行排序"""
-        self.notes.sort(key=lambda note: note.time)
+        """按时间对音符进行排序
+        
+        音符在读取时总是已排序的，这里只是立即合并缓冲区。
+        """
+        self._flush()
+    
+    def cursor(self):
+        """创建一个用于顺序播放的游标
+        
+        Returns:
+            ChartCursor: 谱面游标
+        """
+        return ChartCursor(self)
     
     def to_dict(self):
         """转换为字典形式，用于JSON序列化"""
+        self._flush()
+        names = NOTE_TYPE_NAMES[self._type_codes].tolist()
         return {
             'tempo': self.tempo,
             'duration': self.duration,
             'difficulty': self.difficulty,
-            'notes': [note.to_dict() for note in self.notes]
+            'notes': [
+                {'time': time, 'lane': lane, 'type': name,
+                 'duration': duration, 'intensity': intensity}
+                for time, lane, name, duration, intensity in zip(
+                    self._times.tolist(), self._lanes.tolist(), names,
+                    self._durations.tolist(), self._intensities.tolist())
+            ]
         }
     
     @classmethod
@@ -101,7 +237,7 @@ class Chart:
         
         Args:
             data: 字典数据
-            
+        
         Returns:
             Chart: 谱面对象
         """
@@ -111,8 +247,66 @@ class Chart:
             difficulty=data['difficulty']
         )
         
-        for note_data in data['notes']:
-            note = Note.from_dict(note_data)
-            chart.add_note(note)
-            
-        return chart
\ No newline at end of file
+        # 只遍历一次音符字典，同时填充五列，再整列转换为数组
+        times, lanes, type_codes, durations, intensities = [], [], [], [], []
+        for note in data['notes']:
+            times.append(note['time'])
+            lanes.append(note['lane'])
+            type_codes.append(NOTE_TYPE_CODES[note['type']])
+            durations.append(note.get('duration', 0.0))
+            intensities.append(note.get('intensity', 0.5))
+        chart.add_notes(times, lanes, type_codes, durations, intensities)
+        
+        return chart
+
+
+class ChartCursor:
+    """谱面游标，用于按时间顺序播放时获取当前窗口内的音符
+    
+    游标只向前移动，每次只在剩余的音符中二分查找窗口边界；
+    时间倒退(例如重新开始)时重新定位。
+    """
+    
+    def __init__(self, chart):
+        """初始化游标
+        
+        Args:
+            chart: 谱面对象
+        """
+        self.chart = chart
+        self.start = 0  # 窗口内第一个音符的索引
+        self.end = 0    # 窗口后第一个音符的索引
+        self.last_time = None
+    
+    def seek(self, current_time):
+        """把游标定位到指定时间
+        
+        Args:
+            current_time: 时间(秒)
+        """
+        self.start = int(np.searchsorted(self.chart.times, current_time, side='left'))
+        self.end = self.start
+        self.last_time = current_time
+    
+    def advance(self, current_time, lookahead):
+        """移动游标并返回 [current_time, current_time + lookahead) 内的音符
+        
+        Args:
+            current_time: 当前时间(秒)
+            lookahead: 窗口长度(秒)
+        
+        Returns:
+            list: 窗口内的音符列表
+        """
+        if self.last_time is None or current_time < self.last_time:
+            self.seek(current_time)
+        self.last_time = current_time
+        
+        times = self.chart.times
+        
+        # 窗口两端只向前移动
+        self.start += int(np.searchsorted(times[self.start:], current_time, side='left'))
+        self.end = max(self.end, self.start)
+        self.end += int(np.searchsorted(times[self.end:], current_time + lookahead, side='left'))
+        
+        return list(self.chart.notes[self.start:self.end])
\ No newline at end of file
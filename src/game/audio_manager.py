@@ -1,15 +1,28 @@
+import os
+from src.audio.playback import playback_path
+
 class AudioManager:
     """游戏音频管理器，负责处理音频播放和同步"""
     
-    def __init__(self, audio_path):
+    def __init__(self, audio_path, url=None):
         """初始化音频管理器
         
         Args:
-            audio_path: 音频文件路径
+            audio_path: 原始音频文件路径
+            url: 前端获取音频的地址，None表示直接使用文件路径
         """
         self.audio_path = audio_path
+        self.url = url
         self.is_playing = False
         self.current_time = 0
+    
+    @property
+    def playback_path(self):
+        """实际用于播放的音频文件，转码后的播放版本存在时使用它，否则使用原始文件"""
+        rendition = playback_path(self.audio_path)
+        if os.path.exists(rendition):
+            return rendition
+        return self.audio_path
         
     def to_dict(self):
         """转换为字典形式，用于前端初始化
@@ -18,7 +31,7 @@ class AudioManager:
             dict: 音频信息字典
         """
         return {
-            'audio_path': self.audio_path,
+            'audio_path': self.url or self.playback_path,
             'is_playing': self.is_playing,
             'current_time': self.current_time
         } 
\ No newline at end of file
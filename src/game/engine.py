@@ -1,8 +1,22 @@
 import time
+import numpy as np
+from src.chart.models import Note, NOTE_TYPE_NAMES
 
 class GameEngine:
     """游戏引擎，负责处理游戏逻辑"""
     
+    # 判定窗口: (与音符时间差的上限(秒，包含), 判定结果, 得分)，按窗口从小到大排列，
+    # 与 judge_note 以及 static/js/game.js 一致
+    JUDGEMENT_WINDOWS = (
+        (0.05, 'perfect', 100),
+        (0.1, 'great', 80),
+        (0.15, 'good', 50),
+    )
+    
+    # 按键只判定时间差不超过该值(秒)的音符，超过 good 窗口的判为miss；
+    # 超过该时间仍未判定的音符判为miss，与 static/js/game.js 一致
+    HIT_WINDOW = 0.2
+    
     def __init__(self, chart):
         """初始化游戏引擎
         
@@ -10,6 +24,13 @@ class GameEngine:
             chart: 谱面对象
         """
         self.chart = chart
+        self.cursor = chart.cursor()
+        self._lane_notes = None  # 按轨道分组的音符时间和索引，用于判定，首次判定时计算
+        self.lane_heads = {}  # 轨道 -> 该轨道第一个未判定音符在分组数组中的位置
+        self._judged = {}  # 轨道 -> 该轨道每个音符是否已经判定过
+        self.holding = {}  # 轨道 -> (正在长按的音符, 结束时间)
+        self.completed_holds = 0
+        self.broken_holds = 0
         self.score = 0
         self.combo = 0
         self.max_combo = 0
@@ -24,6 +45,12 @@ class GameEngine:
         """开始游戏"""
         self.start_time = time.time()
         self.is_playing = True
+        self.cursor = self.chart.cursor()
+        self.lane_heads = {}
+        self._judged = {}
+        self.holding = {}
+        self.completed_holds = 0
+        self.broken_holds = 0
         self.score = 0
         self.combo = 0
         self.max_combo = 0
@@ -53,6 +80,8 @@ class GameEngine:
     def get_active_notes(self, current_time, lookahead=2.0):
         """获取当前需要显示的音符
         
+        每帧调用时使用游标向前移动，开销只与窗口内的音符数量有关。
+        
         Args:
             current_time: 当前游戏时间(秒)
             lookahead: 提前显示的时间(秒)
@@ -60,9 +89,147 @@ class GameEngine:
         Returns:
             list: 当前需要显示的音符列表
         """
-        return self.chart.get_notes_in_time_range(
-            current_time, current_time + lookahead
-        )
+        return self.cursor.advance(current_time, lookahead)
+    
+    def _note_at(self, index):
+        """从列数据创建谱面中第 index 个音符的 Note 记录"""
+        columns = self.chart.columns()
+        return Note(float(columns['time'][index]), int(columns['lane'][index]),
+                    NOTE_TYPE_NAMES[columns['type_code'][index]],
+                    float(columns['duration'][index]), float(columns['intensity'][index]))
+    
+    def _lane_judged(self, lane):
+        """该轨道每个音符是否已经判定过，按轨道分组数组中的位置索引"""
+        judged = self._judged.get(lane)
+        if judged is None:
+            judged = self._judged[lane] = np.zeros(len(self._lane_note_times()[lane][0]), dtype=bool)
+        return judged
+    
+    def _expire_lane(self, lane, current_time):
+        """把轨道中超过判定时间仍未判定的音符标记为已判定，并跳过开头已判定的音符
+        
+        待判定位置只向前移动，每帧调用的均摊开销为O(1)。
+        
+        Args:
+            lane: 轨道索引
+            current_time: 当前游戏时间(秒)
+            
+        Returns:
+            list: 本次过期的音符在轨道分组数组中的位置
+        """
+        note_times = self._lane_note_times()[lane][0]
+        judged = self._lane_judged(lane)
+        head = self.lane_heads.get(lane, 0)
+        expired = []
+        while head < len(note_times) and (judged[head] or current_time - note_times[head] > self.HIT_WINDOW):
+            if not judged[head]:
+                judged[head] = True
+                expired.append(head)
+            head += 1
+        self.lane_heads[lane] = head
+        return expired
+    
+    def _closest_note(self, lane, hit_time):
+        """找到轨道中与按键时间最接近的未判定音符，与 game.js 的 _handleNoteHit 一致
+        
+        时间差相同时取较早的音符。调用前需要先用 _expire_lane 移除过期的音符。
+        
+        Args:
+            lane: 轨道索引
+            hit_time: 按下时间(秒)
+            
+        Returns:
+            int: 音符在轨道分组数组中的位置，没有时间差不超过 HIT_WINDOW 的音符时返回None
+        """
+        note_times = self._lane_note_times()[lane][0]
+        judged = self._lane_judged(lane)
+        best, best_diff = None, np.inf
+        position = self.lane_heads.get(lane, 0)
+        while position < len(note_times) and note_times[position] - hit_time <= self.HIT_WINDOW:
+            if not judged[position]:
+                diff = abs(note_times[position] - hit_time)
+                if diff < best_diff:
+                    best, best_diff = position, diff
+            position += 1
+        return best if best_diff <= self.HIT_WINDOW else None
+    
+    def expire_notes(self, current_time, lane=None):
+        """把已经超过判定时间仍未判定的音符判为miss
+        
+        Args:
+            current_time: 当前游戏时间(秒)
+            lane: 只处理指定轨道，None表示所有轨道
+            
+        Returns:
+            list: 本次被判为miss的音符
+        """
+        lane_notes = self._lane_note_times()
+        lanes = lane_notes.keys() if lane is None else [lane]
+        expired = []
+        for key in lanes:
+            if key not in lane_notes:
+                continue
+            positions = self._expire_lane(key, current_time)
+            if not positions:
+                continue
+            self.miss_count += len(positions)
+            self.combo = 0
+            expired.extend(self._note_at(index) for index in lane_notes[key][1][positions])
+        return expired
+    
+    def press(self, lane, hit_time):
+        """处理一次按键，判定该轨道中时间最接近的未判定音符
+        
+        与 game.js 的规则相同：时间差不超过 HIT_WINDOW 的音符才会被判定，超过 good 窗口判为miss。
+        按键前先把所有轨道中已过期的音符判为miss，连击的结果因此不依赖于游戏循环调用
+        expire_notes 的时机，与 verify_replay 一致。
+        命中的长按/滑动音符会记录下来，等待 release 判断是否按到结尾。
+        
+        Args:
+            lane: 轨道索引
+            hit_time: 按下时间(秒)
+            
+        Returns:
+            tuple: (音符, 判定结果)，没有可判定的音符时返回 (None, None)
+        """
+        self.expire_notes(hit_time)
+        lane_notes = self._lane_note_times().get(lane)
+        if lane_notes is None:
+            return None, None
+        position = self._closest_note(lane, hit_time)
+        if position is None:
+            return None, None
+        
+        self._lane_judged(lane)[position] = True
+        note = self._note_at(lane_notes[1][position])
+        result = self.judge_note(note, hit_time)
+        if result != 'miss' and note.type in ('hold', 'slide') and note.duration > 0:
+            self.holding[lane] = (note, note.time + note.duration)
+        return note, result
+    
+    def release(self, lane, release_time):
+        """处理一次松开按键，判断长按/滑动音符是否按到了结尾
+        
+        在结尾之前超过 good 判定窗口松开视为中断。
+        长按结果只做统计，不影响得分和连击。
+        
+        Args:
+            lane: 轨道索引
+            release_time: 松开时间(秒)
+            
+        Returns:
+            tuple: (音符, 'complete' 或 'broken')，该轨道没有正在长按的音符时返回 (None, None)
+        """
+        held = self.holding.pop(lane, None)
+        if held is None:
+            return None, None
+        
+        note, end_time = held
+        if end_time - release_time < self.JUDGEMENT_WINDOWS[-1][0]:
+            self.completed_holds += 1
+            return note, 'complete'
+        self.broken_holds += 1
+        return note, 'broken'
     
     def judge_note(self, note, hit_time):
         """判断音符击打精准度
@@ -76,18 +243,18 @@ class GameEngine:
         """
         time_diff = abs(hit_time - note.time)
         
-        # 判定标准
-        if time_diff < 0.05:
+        # 判定标准，窗口边界包含在内，与 game.js 一致
+        if time_diff <= 0.05:
             result = 'perfect'
             self.perfect_count += 1
             self.score += 100
             self.combo += 1
-        elif time_diff < 0.1:
+        elif time_diff <= 0.1:
             result = 'great'
             self.great_count += 1
             self.score += 80
             self.combo += 1
-        elif time_diff < 0.15:
+        elif time_diff <= 0.15:
             result = 'good'
             self.good_count += 1
             self.score += 50
@@ -103,6 +270,98 @@ class GameEngine:
             
         return result
     
+    def _lane_note_times(self):
+        """按轨道分组的音符时间和音符在谱面中的索引，每个引擎只计算一次"""
+        if self._lane_notes is None:
+            columns = self.chart.columns()
+            self._lane_notes = {}
+            for lane in np.unique(columns['lane']):
+                indices = np.flatnonzero(columns['lane'] == lane)
+                self._lane_notes[int(lane)] = (columns['time'][indices], indices)
+        return self._lane_notes
+    
+    def verify_replay(self, inputs):
+        """一次性批量判定玩家的完整输入记录，用于在服务器端校验成绩
+        
+        使用与 press 相同的规则：按时间顺序处理每次按键，判定同一轨道上时间最接近的未判定音符，
+        超过判定时间仍未判定的音符判为miss。各轨道的按键互不影响，因此逐轨道处理，
+        连击再按 press 中判定发生的先后顺序统一计算，结果与逐次调用 press 后再调用
+        expire_notes 完全相同。
+        松开时间会被接受，但和 judge_note 一样不参与计分。
+        判定结果会覆盖引擎当前的得分统计。
+        
+        Args:
+            inputs: 输入记录，形状为 (n, 2) 或 (n, 3) 的数组，每行为 (轨道, 按下时间, 松开时间)
+            
+        Returns:
+            dict: 与 calculate_final_score 相同格式的结果
+        """
+        inputs = np.asarray(inputs, dtype=float)
+        if inputs.size == 0:
+            inputs = inputs.reshape(0, 2)
+        order = np.argsort(inputs[:, 1], kind='stable')
+        input_lanes = inputs[order, 0].astype(int)
+        press_times = inputs[order, 1]
+        
+        self.lane_heads = {}
+        self._judged = {}
+        self.holding = {}
+        thresholds = np.array([window for window, _, _ in self.JUDGEMENT_WINDOWS])
+        miss_grade = len(thresholds)
+        
+        # 每个音符的判定等级(默认miss)，以及判定发生的顺序:
+        # 第 k 次按键判定的音符为 2k+1，在第 k 次按键之前过期的音符为 2k
+        note_count = len(self.chart.times)
+        grades = np.full(note_count, miss_grade)
+        event_keys = np.zeros(note_count, dtype=np.int64)
+        pressed = np.zeros(note_count, dtype=bool)
+        for lane, (note_times, note_indices) in self._lane_note_times().items():
+            positions = np.flatnonzero(input_lanes == lane)
+            for k, hit_time in zip(positions.tolist(), press_times[positions].tolist()):
+                self._expire_lane(lane, hit_time)
+                position = self._closest_note(lane, hit_time)
+                if position is None:
+                    continue
+                self._lane_judged(lane)[position] = True
+                index = note_indices[position]
+                pressed[index] = True
+                grades[index] = np.searchsorted(thresholds, abs(note_times[position] - hit_time), side='left')
+                event_keys[index] = 2 * k + 1
+        
+        # 没有被按键判定的音符在第一次满足过期条件的按键之前过期，没有这样的按键时在最后过期
+        missed = np.flatnonzero(~pressed)
+        missed_times = self.chart.times[missed]
+        press_count = len(press_times)
+        if press_count:
+            first = np.searchsorted(press_times, missed_times + self.HIT_WINDOW, side='right')
+            # 按与 _expire_lane 完全相同的条件修正浮点误差造成的边界偏差
+            while True:
+                back = (first > 0) & (press_times[np.maximum(first - 1, 0)] - missed_times > self.HIT_WINDOW)
+                if not back.any():
+                    break
+                first -= back
+            while True:
+                forward = (first < press_count) & ~(
+                    press_times[np.minimum(first, press_count - 1)] - missed_times > self.HIT_WINDOW)
+                if not forward.any():
+                    break
+                first += forward
+            event_keys[missed] = 2 * first
+        
+        counts = np.bincount(grades, minlength=miss_grade + 1)
+        points = np.array([points for _, _, points in self.JUDGEMENT_WINDOWS] + [0])
+        
+        # 连击：按判定顺序排列，每次miss开始新的一段，统计每段连续命中的数量
+        hit = grades[np.argsort(event_keys, kind='stable')] < miss_grade
+        run_ids = np.cumsum(~hit)
+        runs = np.bincount(run_ids[hit]) if np.any(hit) else np.zeros(1, dtype=int)
+        
+        self.perfect_count, self.great_count, self.good_count, self.miss_count = (int(c) for c in counts)
+        self.score = int(np.dot(counts, points))
+        self.max_combo = int(runs.max())
+        self.combo = int(runs[run_ids[-1]]) if note_count and hit[-1] else 0
+        return self.calculate_final_score()
+    
     def calculate_final_score(self):
         """计算最终得分和评级
         
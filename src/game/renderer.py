@@ -1,3 +1,40 @@
+import numpy as np
+from config import NOTE_TYPES
+from src.chart.models import NOTE_TYPE_CODES
+
+# 音符强度分成的档数，同一类型同一档强度的音符共用调色板中的一个样式
+INTENSITY_BUCKETS = 8
+
+# 各类型音符的颜色(RGB)
+NOTE_COLORS = {
+    'tap': (0, 255, 255),
+    'hold': (255, 255, 0),
+    'slide': (255, 0, 255)
+}
+
+# 按类型编码索引：该类型是否为带尾部的长音符
+IS_LONG_NOTE = np.zeros(len(NOTE_TYPES), dtype=bool)
+IS_LONG_NOTE[[NOTE_TYPE_CODES['hold'], NOTE_TYPE_CODES['slide']]] = True
+
+
+def make_note_style(note_type, intensity):
+    """根据音符类型和强度生成样式
+    
+    Args:
+        note_type: 音符类型
+        intensity: 音符强度(0-1)
+        
+    Returns:
+        dict: 包含音符样式的字典
+    """
+    red, green, blue = NOTE_COLORS.get(note_type, NOTE_COLORS['tap'])
+    return {
+        'radius': 20,
+        'color': f'rgba({red}, {green}, {blue}, {0.7 + intensity * 0.3})',
+        'border': '2px solid white'
+    }
+
+
 class GameRenderer:
     """游戏渲染器，负责在界面上绘制游戏元素"""
     
@@ -10,6 +47,15 @@ class GameRenderer:
         """
         self.lanes = lanes
         self.note_speed = note_speed
+        self.lane_width = 100  # 轨道宽度(像素)
+        
+        # 调色板：下标为 类型编码 * INTENSITY_BUCKETS + 强度档位
+        self.palette = [
+            make_note_style(note_type, bucket / (INTENSITY_BUCKETS - 1))
+            for note_type in NOTE_TYPES
+            for bucket in range(INTENSITY_BUCKETS)
+        ]
+        self._lookback = (None, 0.0)  # (谱面的时长数组, 最长时长)，谱面修改后数组会被替换
         
     def calculate_note_position(self, note, current_time, canvas_height):
         """计算音符在画布上的位置
@@ -30,8 +76,7 @@ class GameRenderer:
         y_position = canvas_height - distance
         
         # 计算轨道位置 (水平方向)
-        lane_width = 100  # 轨道宽度(像素)
-        x_position = note.lane * lane_width + lane_width / 2
+        x_position = note.lane * self.lane_width + self.lane_width / 2
         
         return {
             'x': x_position,
@@ -51,25 +96,7 @@ class GameRenderer:
             dict: 包含音符样式的字典
         """
         # 根据音符类型和强度确定样式
-        styles = {
-            'tap': {
-                'radius': 20,
-                'color': f'rgba(0, 255, 255, {0.7 + note.intensity * 0.3})',
-                'border': '2px solid white'
-            },
-            'hold': {
-                'radius': 20,
-                'color': f'rgba(255, 255, 0, {0.7 + note.intensity * 0.3})',
-                'border': '2px solid white'
-            },
-            'slide': {
-                'radius': 20,
-                'color': f'rgba(255, 0, 255, {0.7 + note.intensity * 0.3})',
-                'border': '2px solid white'
-            }
-        }
-        
-        return styles.get(note.type, styles['tap'])
+        return make_note_style(note.type, note.intensity)
     
     def generate_note_element(self, note_position, note_style):
         """生成音符HTML元素
@@ -101,4 +128,84 @@ class GameRenderer:
             """
         
         element += "</div>"
-        return element
\ No newline at end of file
+        return element
+    
+    def visible_columns(self, chart, current_time, canvas_height):
+        """取出当前画面中可见音符的列数据
+        
+        音符头部在画布内，或者长音符的尾部还没有完全越过判定线时可见。
+        
+        Args:
+            chart: 谱面对象
+            current_time: 当前游戏时间(秒)
+            canvas_height: 画布高度(像素)
+            
+        Returns:
+            dict: time, lane, type_code, duration, intensity 五个数组，
+                  以及 index(音符在谱面中的下标)
+        """
+        columns = chart.columns()
+        times = columns['time']
+        if len(times) == 0:
+            return dict(columns, index=np.arange(0))
+        
+        # 尾部最长的音符决定需要往回查找多远
+        durations, lookback = self._lookback
+        if durations is not columns['duration']:
+            lookback = float(columns['duration'].max())
+            self._lookback = (columns['duration'], lookback)
+        start = np.searchsorted(times, current_time - lookback, side='left')
+        end = np.searchsorted(times, current_time + canvas_height / self.note_speed, side='right')
+        
+        index = np.arange(start, end)
+        visible = {key: values[start:end] for key, values in columns.items()}
+        long_note = IS_LONG_NOTE[visible['type_code']]
+        end_times = visible['time'] + np.where(long_note, visible['duration'], 0.0)
+        keep = end_times >= current_time
+        if not keep.all():
+            visible = {key: values[keep] for key, values in visible.items()}
+            index = index[keep]
+        visible['index'] = index
+        return visible
+    
+    def draw_notes(self, columns, current_time, canvas_height):
+        """批量计算一组音符的绘制数据
+        
+        与 calculate_note_position / get_note_style 的结果一致，但一次计算所有音符，
+        样式以调色板下标表示，音符强度取最接近的档位。
+        
+        Args:
+            columns: 音符列数据(例如 visible_columns 的返回值)
+            current_time: 当前游戏时间(秒)
+            canvas_height: 画布高度(像素)
+            
+        Returns:
+            dict: x, y, length(尾部长度，像素) 三个浮点数组和 style(调色板下标)数组
+        """
+        type_codes = np.asarray(columns['type_code'])
+        durations = np.asarray(columns['duration'], dtype=np.float64)
+        
+        y = canvas_height - (np.asarray(columns['time'], dtype=np.float64) - current_time) * self.note_speed
+        x = np.asarray(columns['lane'], dtype=np.float64) * self.lane_width + self.lane_width / 2
+        length = np.where(IS_LONG_NOTE[type_codes], durations * self.note_speed, 0.0)
+        
+        buckets = np.rint(np.clip(columns['intensity'], 0.0, 1.0) * (INTENSITY_BUCKETS - 1))
+        style = type_codes.astype(np.int16) * INTENSITY_BUCKETS + buckets.astype(np.int16)
+        
+        return {'x': x, 'y': y, 'length': length, 'style': style}
+    
+    def draw_list(self, chart, current_time, canvas_height):
+        """计算当前画面中所有可见音符的绘制数据
+        
+        Args:
+            chart: 谱面对象
+            current_time: 当前游戏时间(秒)
+            canvas_height: 画布高度(像素)
+            
+        Returns:
+            dict: draw_notes 的结果，另外包含 index(音符在谱面中的下标)
+        """
+        visible = self.visible_columns(chart, current_time, canvas_height)
+        draw = self.draw_notes(visible, current_time, canvas_height)
+        draw['index'] = visible['index']
+        return draw
@@ -0,0 +1,231 @@
+"""批量为音乐库生成谱面
+
+遍历目录中所有支持格式的音频文件，在预热过的进程池中分析音频并生成所有难度的谱面，
+通过 ChartStorage 完整保存。谱面与上传流程一样保存在按内容共享的ID下(见 save_shared_charts)，
+之后上传同一首歌时直接使用这些谱面；内容相同的文件只生成一次。
+
+每处理完一个文件就向清单文件追加一行记录，中断后重新运行同一命令会跳过已经完成、
+且大小和修改时间没有变化的文件。
+
+用法:
+    python -m src.utils.bulk 音乐目录 [--workers 4] [--output static/charts]
+        [--manifest cache/bulk_manifest.jsonl] [--difficulties easy normal hard]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.audio.analyzer import create_analyzer
+from src.audio.warmup import warm_up_worker
+from src.utils import metrics
+from src.utils.chart_storage import ChartStorage, shared_chart_id
+from src.utils.feature_cache import FeatureCache
+from src.utils.file_handler import hash_file
+from src.utils.pipeline import save_shared_charts
+from config import ALLOWED_EXTENSIONS, DIFFICULTY_LEVELS, ANALYSIS_WORKERS, CACHE_FOLDER
+
+# 默认的清单文件，记录了音乐库中的文件路径，不能放在公开访问的 static 目录中
+DEFAULT_MANIFEST = os.path.join(CACHE_FOLDER, 'bulk_manifest.jsonl')
+
+
+def find_audio_files(root):
+    """递归查找目录中所有支持格式的音频文件
+
+    Args:
+        root: 音乐库目录
+
+    Returns:
+        list: 按路径排序的音频文件路径
+    """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in filenames:
+            ext = os.path.splitext(filename)[1].lower().lstrip('.')
+            if ext in ALLOWED_EXTENSIONS:
+                files.append(os.path.join(dirpath, filename))
+    return sorted(files)
+
+
+def file_signature(path):
+    """文件的大小和修改时间，文件被替换后需要重新处理"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def load_manifest(manifest_path):
+    """读取清单中已经成功处理的文件
+
+    清单每行一个JSON记录，同一文件出现多次时以最后一次为准；
+    中断时可能写了一半的最后一行会被忽略。
+
+    Args:
+        manifest_path: 清单文件路径
+
+    Returns:
+        dict: 文件路径 -> 成功处理的记录
+    """
+    done = {}
+    if not os.path.exists(manifest_path):
+        return done
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('status') == 'done':
+                done[entry['path']] = entry
+            else:
+                done.pop(entry.get('path'), None)
+    return done
+
+
+def process_library_file(path, storage_dir, difficulties):
+    """分析一个音频文件并保存所有难度的谱面，在进程池中执行
+
+    特征按内容哈希缓存，已经分析过的歌曲直接复用；已经保存过的谱面不再生成。
+
+    Args:
+        path: 音频文件路径
+        storage_dir: ChartStorage 的目录
+        difficulties: 难度列表
+
+    Returns:
+        tuple: (处理结果摘要, 记录的指标操作)
+    """
+    start = time.perf_counter()
+    with metrics.collect() as collected:
+        audio_hash = hash_file(path)
+        cache = FeatureCache()
+        features = cache.load_features(audio_hash)
+        cached = features is not None
+        if not cached:
+            features = create_analyzer(path).extract_features()
+            cache.save_features(audio_hash, features)
+
+        storage = ChartStorage(base_dir=storage_dir, memory_limit=0)
+        notes = save_shared_charts(storage, features, audio_hash, difficulties)
+
+    summary = {
+        'audio_hash': audio_hash,
+        'chart_id': shared_chart_id(audio_hash),
+        'difficulties': list(difficulties),
+        'cached': cached,
+        'duration': float(features.duration),
+        'notes': notes,
+        'seconds': time.perf_counter() - start
+    }
+    return summary, collected
+
+
+def _format_rate(files, audio_seconds, elapsed):
+    """格式化吞吐量：每分钟处理的文件数和音频小时数"""
+    minutes = max(elapsed, 1e-9) / 60
+    return f"{files / minutes:.1f} 文件/分钟, {audio_seconds / 3600 / minutes:.2f} 音频小时/分钟"
+
+
+def run(root, storage_dir, manifest_path, difficulties, workers):
+    """批量处理音乐库
+
+    Args:
+        root: 音乐库目录
+        storage_dir: ChartStorage 的目录
+        manifest_path: 清单文件路径
+        difficulties: 难度列表
+        workers: 进程数量
+
+    Returns:
+        dict: 处理统计
+    """
+    files = find_audio_files(root)
+    done = load_manifest(manifest_path)
+
+    pending = []
+    for path in files:
+        entry = done.get(os.path.relpath(path, root))
+        if entry is not None and tuple(entry['signature']) == file_signature(path) \
+                and set(difficulties) <= set(entry.get('difficulties', ())):
+            continue
+        pending.append(path)
+
+    skipped = len(files) - len(pending)
+    print(f"找到 {len(files)} 个音频文件，{skipped} 个已经完成，待处理 {len(pending)} 个")
+
+    stats = {'total': len(files), 'skipped': skipped, 'done': 0, 'failed': 0,
+             'audio_seconds': 0.0, 'elapsed': 0.0}
+    if not pending:
+        return stats
+
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    start = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=warm_up_worker) as executor, \
+            open(manifest_path, 'a', encoding='utf-8') as manifest:
+        futures = {
+            executor.submit(process_library_file, path, storage_dir, difficulties): path
+            for path in pending
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            entry = {'path': os.path.relpath(path, root), 'signature': list(file_signature(path))}
+            try:
+                summary, collected = future.result()
+            except Exception as e:
+                stats['failed'] += 1
+                metrics.FAILURES.inc(operation='bulk')
+                error = f"{type(e).__name__}: {e}"
+                entry.update(status='failed', error=error)
+                message = f"失败: {error}"
+            else:
+                metrics.replay(collected)
+                stats['done'] += 1
+                stats['audio_seconds'] += summary['duration']
+                entry.update(summary, status='done')
+                message = f"{summary['duration']:.0f}s 音频, 用时 {summary['seconds']:.1f}s" \
+                          + (' (特征已缓存)' if summary['cached'] else '')
+
+            # 每处理完一个文件立即写入清单，中断后可以继续
+            manifest.write(json.dumps(entry) + '\n')
+            manifest.flush()
+
+            finished = stats['done'] + stats['failed']
+            elapsed = time.perf_counter() - start
+            eta = elapsed / finished * (len(pending) - finished)
+            print(f"[{finished}/{len(pending)}] {entry['path']}: {message} | "
+                  f"{_format_rate(finished, stats['audio_seconds'], elapsed)}, 剩余约 {eta:.0f}s")
+
+    stats['elapsed'] = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量为音乐库生成谱面')
+    parser.add_argument('root', help='音乐库目录')
+    parser.add_argument('--output', default='static/charts', help='谱面保存目录')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help='清单文件路径')
+    parser.add_argument('--difficulties', nargs='+', choices=list(DIFFICULTY_LEVELS),
+                        default=list(DIFFICULTY_LEVELS), help='要生成的难度')
+    parser.add_argument('--workers', type=int, default=max(ANALYSIS_WORKERS, os.cpu_count() or 1),
+                        help='分析进程数量')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        parser.error(f"目录不存在: {args.root}")
+    stats = run(args.root, args.output, args.manifest, args.difficulties, args.workers)
+
+    print(f"\n完成 {stats['done']} 个，失败 {stats['failed']} 个，跳过 {stats['skipped']} 个")
+    if stats['done']:
+        print(f"总用时 {stats['elapsed']:.1f}s，共 {stats['audio_seconds'] / 3600:.2f} 小时音频，"
+              f"{_format_rate(stats['done'], stats['audio_seconds'], stats['elapsed'])}")
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
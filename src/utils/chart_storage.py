@@ -1,52 +1,386 @@
-import os
 import json
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
 from pathlib import Path
+from src.chart.codec import encode_chart, CHART_BINARY_MIMETYPE
+from src.chart.generator import GENERATOR_VERSION
+from src.utils.compression import ENCODINGS, ENCODING_SUFFIXES, compress_variants
+from src.utils.file_handler import write_atomic
+from src.utils.metrics import STORAGE_SECONDS, cache_result
+from config import DIFFICULTY_LEVELS, CHART_MEMORY_CACHE_BYTES
+
+# 解析后的谱面字典中每个音符大约占用的内存(字节)，用于估算缓存大小
+NOTE_MEMORY_BYTES = 320
+
+# 可以直接作为HTTP响应发送的谱面数据
+#   body: 未压缩的响应体
+#   mimetype: 响应的MIME类型
+#   etag: 由响应体内容哈希得到的强ETag(不含引号)
+#   variants: 内容编码 -> 预压缩的响应体
+#   mtime: 完整保存的谱面文件的修改时间(纳秒)，文件可能被原地覆盖(例如批量生成)；
+#          共享谱面不存在、按引用临时生成的谱面为None
+ChartPayload = namedtuple('ChartPayload', ['body', 'mimetype', 'etag', 'variants', 'mtime'])
+
+# 内存缓存中每个难度可能保存的数据种类，ref 为会话引用解析的结果
+_CACHE_KINDS = ('json', 'binary', 'json-payload', 'binary-payload', 'ref')
+
+
+def shared_chart_id(feature_hash):
+    """同一首歌的完整谱面在所有会话之间共享时使用的存储ID
+
+    ID包含生成器版本，生成器升级后旧的谱面不再被引用。
+
+    Args:
+        feature_hash: 音频内容哈希
+
+    Returns:
+        str: 存储ID，可以代替会话ID使用
+    """
+    return f"{feature_hash}-g{GENERATOR_VERSION}"
+
 
 class ChartStorage:
-    """谱面数据存储管理器"""
+    """谱面数据存储管理器
+    
+    谱面可以完整保存，也可以只保存一个引用 (特征哈希, 难度, 种子, 生成器版本)。
+    只保存引用的会话读取 shared_chart_id 下按内容共享的完整谱面，共享谱面不存在时
+    由 chart_resolver 按引用重新生成。
+    完整保存的谱面同时写入JSON和紧凑的二进制格式(见 src/chart/codec.py)。
+    
+    文件按会话ID哈希的前两位分到子目录中，写入时先写临时文件再重命名；
+    最近读取的谱面保留在内存中，按估算的内存占用做LRU淘汰。
+    保存时同时写入gzip/brotli预压缩版本，发送谱面时不需要再压缩。
+    """
     
-    def __init__(self, base_dir='static/charts'):
+    def __init__(self, base_dir='static/charts', chart_resolver=None,
+                 memory_limit=CHART_MEMORY_CACHE_BYTES):
         """初始化存储管理器
         
         Args:
             base_dir: 存储谱面数据的基础目录
+            chart_resolver: 根据谱面引用重建谱面数据的函数，返回谱面数据字典或None
+            memory_limit: 内存缓存的最大字节数(估算值)，0表示不缓存
         """
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.chart_resolver = chart_resolver
+        self.memory_limit = memory_limit
+        self._memory = OrderedDict()  # (会话ID, 难度, 格式) -> (数据, 估算字节数)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+    
+    def _shard_dir(self, session_id):
+        """获取会话所在的分片目录，避免单个目录中的文件过多"""
+        shard = hashlib.sha1(session_id.encode('utf-8')).hexdigest()[:2]
+        return self.base_dir / shard
+    
+    def _chart_path(self, session_id, difficulty):
+        """获取谱面文件路径，每个难度一个文件"""
+        return self._shard_dir(session_id) / f"{session_id}_{difficulty}.json"
+    
+    def _binary_path(self, session_id, difficulty):
+        """获取二进制谱面文件路径"""
+        return self._shard_dir(session_id) / f"{session_id}_{difficulty}.chart"
+    
+    def _ref_path(self, session_id, difficulty):
+        """获取谱面引用文件路径"""
+        return self._shard_dir(session_id) / f"{session_id}_{difficulty}.ref.json"
+    
+    def _variant_path(self, path, encoding):
+        """获取预压缩版本的文件路径"""
+        return path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+    
+    def _write_with_variants(self, path, data):
+        """写入文件及其所有预压缩版本
+        
+        压缩版本先写入，原文件存在时说明压缩版本已经写完。
+        """
+        for encoding, compressed in compress_variants(data).items():
+            write_atomic(self._variant_path(path, encoding), lambda f: f.write(compressed))
+        write_atomic(path, lambda f: f.write(data))
+    
+    def _cache_get(self, key):
+        """从内存缓存中读取，命中时移到最近使用的位置"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        cache_result('chart_memory', entry is not None)
+        return entry[0] if entry is not None else None
+    
+    def _cache_put(self, key, value):
+        """放入内存缓存，超过内存上限时淘汰最久未使用的谱面"""
+        if isinstance(value, bytes):
+            size = len(value)
+        elif isinstance(value, ChartPayload):
+            size = len(value.body) + sum(len(data) for data in value.variants.values())
+        elif isinstance(value, tuple):
+            size = 1024
+        else:
+            size = 1024 + NOTE_MEMORY_BYTES * len(value.get('notes', ()))
+        if size > self.memory_limit:
+            return
+        
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old[1]
+            self._memory[key] = (value, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_limit:
+                _, (_, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+    
+    def _cache_discard(self, session_id, difficulty):
+        """移除会话某个难度的所有缓存数据"""
+        with self._lock:
+            for kind in _CACHE_KINDS:
+                entry = self._memory.pop((session_id, difficulty, kind), None)
+                if entry is not None:
+                    self._memory_bytes -= entry[1]
+    
+    def _resolve(self, session_id, difficulty):
+        """确定会话的谱面实际保存在哪个ID下
+        
+        会话自己完整保存了谱面时就是会话ID；只保存了引用时是共享的谱面ID，
+        解析结果保留在内存缓存中。
+        
+        Returns:
+            tuple: (谱面文件所在的ID, 谱面引用字典或None)
+        """
+        key = (session_id, difficulty, 'ref')
+        resolved = self._cache_get(key)
+        if resolved is not None:
+            return resolved
+        
+        chart_ref = None
+        if not self._chart_path(session_id, difficulty).exists():
+            chart_ref = self.load_chart_ref(session_id, difficulty)
+        if chart_ref is None:
+            return session_id, None
+        
+        resolved = (shared_chart_id(chart_ref['feature_hash']), chart_ref)
+        self._cache_put(key, resolved)
+        return resolved
+    
+    def has_chart(self, session_id, difficulty='normal'):
+        """是否已经完整保存了谱面(不解析引用)
+        
+        Args:
+            session_id: 会话ID或共享的谱面ID
+            difficulty: 难度级别
+        
+        Returns:
+            bool: 谱面的所有文件是否都已写入
+        """
+        # 二进制谱面最后写入
+        return self._binary_path(session_id, difficulty).exists()
+    
+    def save_chart_ref(self, session_id, chart_ref, difficulty='normal'):
+        """保存谱面引用，代替完整的音符列表
+        
+        Args:
+            session_id: 会话ID
+            chart_ref: 谱面引用字典(feature_hash, difficulty, seed, generator_version, audio_path)
+            difficulty: 难度级别
+        """
+        data = json.dumps(chart_ref).encode('utf-8')
+        with STORAGE_SECONDS.time(operation='save_chart_ref'):
+            write_atomic(self._ref_path(session_id, difficulty), lambda f: f.write(data))
+        self._cache_discard(session_id, difficulty)
+    
+    def load_chart_ref(self, session_id, difficulty='normal'):
+        """加载谱面引用
+        
+        Args:
+            session_id: 会话ID
+            difficulty: 难度级别
+        
+        Returns:
+            dict: 谱面引用字典，如果不存在则返回None
+        """
+        ref_path = self._ref_path(session_id, difficulty)
+        if not ref_path.exists():
+            return None
+        
+        with open(ref_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
     
-    def save_chart(self, session_id, chart_data):
+    def save_chart(self, session_id, chart_data, difficulty='normal'):
         """保存谱面数据到文件
         
         Args:
             session_id: 会话ID
             chart_data: 谱面数据字典
+            difficulty: 难度级别
+        """
+        with STORAGE_SECONDS.time(operation='save_chart'):
+            self._write_with_variants(self._chart_path(session_id, difficulty),
+                                      json.dumps(chart_data).encode('utf-8'))
+            self._write_with_variants(self._binary_path(session_id, difficulty),
+                                      encode_chart(chart_data))
+        self._cache_discard(session_id, difficulty)
+    
+    def load_chart(self, session_id, difficulty='normal'):
+        """加载谱面数据，优先从内存缓存读取
+        
+        返回的字典会在多个请求之间共享，调用方不能修改它。
+        
+        Args:
+            session_id: 会话ID
+            difficulty: 难度级别
+        
+        Returns:
+            dict: 谱面数据字典，如果谱面不存在或无法重建则返回None
         """
-        chart_path = self.base_dir / f"{session_id}.json"
-        with open(chart_path, 'w', encoding='utf-8') as f:
-            json.dump(chart_data, f)
+        chart_id, chart_ref = self._resolve(session_id, difficulty)
+        key = (chart_id, difficulty, 'json')
+        chart_data = self._cache_get(key)
+        if chart_data is not None:
+            return chart_data
+        
+        chart_path = self._chart_path(chart_id, difficulty)
+        if chart_path.exists():
+            with STORAGE_SECONDS.time(operation='load_chart'), \
+                    open(chart_path, 'r', encoding='utf-8') as f:
+                chart_data = json.load(f)
+        else:
+            # 共享谱面不存在时按引用重建
+            if chart_ref is None or self.chart_resolver is None:
+                return None
+            chart_data = self.chart_resolver(chart_ref)
+            if chart_data is None:
+                return None
+        
+        self._cache_put(key, chart_data)
+        return chart_data
     
-    def load_chart(self, session_id):
-        """从文件加载谱面数据
+    def load_chart_binary(self, session_id, difficulty='normal'):
+        """加载二进制格式的谱面，优先从内存缓存读取
         
         Args:
             session_id: 会话ID
+            difficulty: 难度级别
+        
+        Returns:
+            bytes: 二进制谱面，如果谱面不存在或无法重建则返回None
+        """
+        chart_id, _ = self._resolve(session_id, difficulty)
+        key = (chart_id, difficulty, 'binary')
+        chart_bytes = self._cache_get(key)
+        if chart_bytes is not None:
+            return chart_bytes
+        
+        binary_path = self._binary_path(chart_id, difficulty)
+        if binary_path.exists():
+            with STORAGE_SECONDS.time(operation='load_chart_binary'):
+                chart_bytes = binary_path.read_bytes()
+        else:
+            # 按引用重建的谱面再编码
+            chart_data = self.load_chart(session_id, difficulty)
+            if chart_data is None:
+                return None
+            chart_bytes = encode_chart(chart_data)
+        
+        self._cache_put(key, chart_bytes)
+        return chart_bytes
+    
+    def load_chart_payload(self, session_id, difficulty='normal', binary=False):
+        """加载可以直接发送的谱面响应数据，包括ETag和预压缩版本
+        
+        完整保存的谱面(包括只保存了引用的会话所共享的谱面)直接读取文件，不需要解析、
+        重新序列化或压缩，文件被覆盖后重新读取。
+        共享谱面不存在时按引用重新生成，这种情况很少出现，不在请求中压缩。
+        
+        Args:
+            session_id: 会话ID
+            difficulty: 难度级别
+            binary: 是否使用二进制格式，否则为JSON
             
         Returns:
-            dict: 谱面数据字典，如果文件不存在则返回None
+            ChartPayload: 谱面响应数据，如果谱面不存在或无法重建则返回None
         """
-        chart_path = self.base_dir / f"{session_id}.json"
-        if not chart_path.exists():
+        chart_id, _ = self._resolve(session_id, difficulty)
+        if binary:
+            path = self._binary_path(chart_id, difficulty)
+            mimetype = CHART_BINARY_MIMETYPE
+        else:
+            path = self._chart_path(chart_id, difficulty)
+            mimetype = 'application/json'
+        
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        
+        key = (chart_id, difficulty, 'binary-payload' if binary else 'json-payload')
+        payload = self._cache_get(key)
+        # 谱面文件被其他进程写入或覆盖后，内存中的数据和ETag都已过期
+        if payload is not None and payload.mtime == mtime:
+            return payload
+        
+        variants = {}
+        if mtime is not None:
+            with STORAGE_SECONDS.time(operation='load_chart_payload'):
+                body = path.read_bytes()
+                for encoding in ENCODINGS:
+                    variant_path = self._variant_path(path, encoding)
+                    if variant_path.exists():
+                        variants[encoding] = variant_path.read_bytes()
+        elif binary:
+            body = self.load_chart_binary(session_id, difficulty)
+        else:
+            chart_data = self.load_chart(session_id, difficulty)
+            body = json.dumps(chart_data).encode('utf-8') if chart_data is not None else None
+        if body is None:
             return None
+        
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        payload = ChartPayload(body, mimetype, etag, variants, mtime)
+        self._cache_put(key, payload)
+        return payload
+    
+    def load_chart_body(self, session_id, difficulty='normal'):
+        """加载未压缩的JSON谱面，用于嵌入其他响应，不读取预压缩版本
+        
+        Args:
+            session_id: 会话ID
+            difficulty: 难度级别
             
-        with open(chart_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        Returns:
+            bytes: JSON谱面，如果谱面不存在或无法重建则返回None
+        """
+        chart_id, _ = self._resolve(session_id, difficulty)
+        path = self._chart_path(chart_id, difficulty)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        
+        payload = self._cache_get((chart_id, difficulty, 'json-payload'))
+        if payload is not None and payload.mtime == mtime:
+            return payload.body
+        
+        if mtime is not None:
+            with STORAGE_SECONDS.time(operation='load_chart_body'):
+                return path.read_bytes()
+        chart_data = self.load_chart(session_id, difficulty)
+        return json.dumps(chart_data).encode('utf-8') if chart_data is not None else None
     
     def delete_chart(self, session_id):
-        """删除谱面数据文件
+        """删除会话所有难度的谱面数据文件
         
         Args:
             session_id: 会话ID
         """
-        chart_path = self.base_dir / f"{session_id}.json"
-        if chart_path.exists():
-            chart_path.unlink() 
\ No newline at end of file
+        for difficulty in DIFFICULTY_LEVELS:
+            self._cache_discard(session_id, difficulty)
+            paths = [self._ref_path(session_id, difficulty)]
+            for path in (self._chart_path(session_id, difficulty),
+                         self._binary_path(session_id, difficulty)):
+                paths.append(path)
+                paths.extend(self._variant_path(path, encoding) for encoding in ENCODING_SUFFIXES)
+            for path in paths:
+                if path.exists():
+                    path.unlink()
\ No newline at end of file
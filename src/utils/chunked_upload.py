@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from src.utils.file_handler import write_atomic
+from config import UPLOAD_PARTIAL_FOLDER, UPLOAD_MAX_BYTES, UPLOAD_PARTIAL_MAX_BYTES, UPLOAD_PARTIAL_TTL
+
+# 两次清理过期上传之间的最短间隔(秒)
+CLEANUP_INTERVAL = 10 * 60
+
+
+class UploadError(ValueError):
+    """分块上传的请求不合法时抛出"""
+
+
+class UploadOffsetError(UploadError):
+    """上传块的偏移量与服务器已接收的字节数不一致时抛出
+
+    客户端应当查询当前偏移量后从该位置继续上传。
+    """
+
+    def __init__(self, expected):
+        super().__init__(f"上传偏移量应为 {expected}")
+        self.expected = expected
+
+
+class UploadQuotaError(UploadError):
+    """未完成上传占用的空间已达上限时抛出，客户端应当稍后重试"""
+
+
+class ChunkedUploadManager:
+    """分块上传管理器，支持断点续传
+
+    每个上传对应一个 .part 数据文件和一个 .json 元数据文件，上传块直接追加写入磁盘，
+    同时增量计算内容哈希；已接收的字节数就是数据文件的大小，因此连接中断或服务重启后
+    都可以从该位置继续上传。进程内没有哈希状态时(例如重启后)从磁盘重新计算。
+
+    超过 ttl 秒没有收到新数据的上传会被清理；所有未完成上传声明的大小之和不能超过 max_total_bytes。
+    """
+
+    def __init__(self, base_dir=UPLOAD_PARTIAL_FOLDER, max_bytes=UPLOAD_MAX_BYTES,
+                 read_size=1024 * 1024, max_total_bytes=UPLOAD_PARTIAL_MAX_BYTES,
+                 ttl=UPLOAD_PARTIAL_TTL):
+        """初始化上传管理器
+
+        Args:
+            base_dir: 未完成上传的存放目录
+            max_bytes: 单个文件的最大字节数
+            read_size: 从请求流每次读取的字节数
+            max_total_bytes: 所有未完成上传声明大小的总和上限
+            ttl: 未完成上传的保留时间(秒)，从最后一次收到数据开始计算
+        """
+        self.base_dir = base_dir
+        self.max_bytes = max_bytes
+        self.read_size = read_size
+        self.max_total_bytes = max_total_bytes
+        self.ttl = ttl
+        self._last_cleanup = 0.0
+        self._hashes = {}  # 上传ID -> (已计算的字节数, sha256对象)
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _part_path(self, upload_id):
+        """获取上传数据文件路径"""
+        return os.path.join(self.base_dir, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id):
+        """获取上传元数据文件路径"""
+        return os.path.join(self.base_dir, f"{upload_id}.json")
+
+    def _upload_lock(self, upload_id):
+        """获取单个上传的锁，同一上传的块不能并发写入"""
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _load_meta(self, upload_id):
+        """读取上传元数据，上传不存在时抛出 KeyError"""
+        try:
+            uuid.UUID(hex=upload_id)
+            with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (ValueError, FileNotFoundError):
+            raise KeyError(upload_id)
+
+    def _pending_uploads(self):
+        """列出所有未完成上传的ID"""
+        return [name[:-len('.json')] for name in os.listdir(self.base_dir) if name.endswith('.json')]
+
+    def _remove(self, upload_id):
+        """删除上传的数据和元数据，先删除元数据，之后的请求都会认为上传不存在"""
+        for path in (self._meta_path(upload_id), self._part_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._hashes.pop(upload_id, None)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+
+    def clean_stale(self, max_age=None):
+        """清理超过保留时间没有收到新数据的上传
+
+        Args:
+            max_age: 保留时间(秒)，None表示使用 ttl
+
+        Returns:
+            int: 清理的上传数量
+        """
+        max_age = self.ttl if max_age is None else max_age
+        now = time.time()
+        removed = 0
+        for upload_id in self._pending_uploads():
+            lock = self._upload_lock(upload_id)
+            # 正在写入的上传不清理
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                mtimes = []
+                for path in (self._meta_path(upload_id), self._part_path(upload_id)):
+                    try:
+                        mtimes.append(os.path.getmtime(path))
+                    except FileNotFoundError:
+                        pass
+                if mtimes and now - max(mtimes) > max_age:
+                    self._remove(upload_id)
+                    removed += 1
+            finally:
+                lock.release()
+        self._last_cleanup = now
+        return removed
+
+    def _reserved_bytes(self):
+        """所有未完成上传声明的大小之和"""
+        total = 0
+        for upload_id in self._pending_uploads():
+            try:
+                total += self._load_meta(upload_id)['size']
+            except KeyError:
+                continue
+        return total
+
+    def _hash_state(self, upload_id, offset):
+        """获取覆盖前 offset 个字节的哈希状态，必要时从磁盘重新计算"""
+        state = self._hashes.get(upload_id)
+        if state is not None and state[0] == offset:
+            return state[1]
+
+        digest = hashlib.sha256()
+        remaining = offset
+        with open(self._part_path(upload_id), 'rb') as f:
+            while remaining > 0:
+                chunk = f.read(min(self.read_size, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+        return digest
+
+    def create(self, filename, size, **meta):
+        """创建一个新的上传
+
+        Args:
+            filename: 原始文件名
+            size: 文件总字节数
+            **meta: 需要随上传保存的其他信息(例如难度)
+
+        Returns:
+            str: 上传ID
+
+        Raises:
+            UploadError: 文件大小不合法
+            UploadQuotaError: 未完成上传占用的空间已达上限
+        """
+        if size <= 0 or size > self.max_bytes:
+            raise UploadError(f"文件大小必须在 1 到 {self.max_bytes} 字节之间")
+
+        # 顺便清理被放弃的上传，每隔 CLEANUP_INTERVAL 秒最多一次
+        if time.time() - self._last_cleanup > CLEANUP_INTERVAL:
+            self.clean_stale()
+        reserved = self._reserved_bytes()
+        if reserved + size > self.max_total_bytes and self.clean_stale():
+            # 空间不足时立即清理一次再检查
+            reserved = self._reserved_bytes()
+        if reserved + size > self.max_total_bytes:
+            raise UploadQuotaError('服务器上未完成的上传过多，请稍后再试')
+
+        upload_id = uuid.uuid4().hex
+        data = dict(meta, filename=filename, size=size)
+        open(self._part_path(upload_id), 'wb').close()
+        write_atomic(self._meta_path(upload_id),
+                     lambda f: f.write(json.dumps(data).encode('utf-8')))
+        self._hashes[upload_id] = (0, hashlib.sha256())
+        return upload_id
+
+    def status(self, upload_id):
+        """查询上传状态
+
+        Args:
+            upload_id: 上传ID
+
+        Returns:
+            dict: 包含 offset(已接收字节数)、size 以及创建时保存的信息
+
+        Raises:
+            KeyError: 上传不存在
+        """
+        meta = self._load_meta(upload_id)
+        try:
+            meta['offset'] = os.path.getsize(self._part_path(upload_id))
+        except FileNotFoundError:
+            # 数据文件已被完成或清理
+            raise KeyError(upload_id)
+        return meta
+
+    def append(self, upload_id, offset, stream):
+        """从流中读取一个上传块并追加到数据文件
+
+        Args:
+            upload_id: 上传ID
+            offset: 该块在文件中的起始位置，必须等于已接收的字节数
+            stream: 可读的二进制流(例如 request.stream)
+
+        Returns:
+            dict: 上传状态，offset 等于 size 时上传完成
+
+        Raises:
+            KeyError: 上传不存在
+            UploadOffsetError: 偏移量不匹配
+            UploadError: 数据超过声明的文件大小
+        """
+        with self._upload_lock(upload_id):
+            meta = self.status(upload_id)
+            current = meta['offset']
+            if offset != current:
+                raise UploadOffsetError(current)
+
+            digest = self._hash_state(upload_id, current)
+            try:
+                with open(self._part_path(upload_id), 'ab') as f:
+                    for chunk in iter(lambda: stream.read(self.read_size), b''):
+                        if current + len(chunk) > meta['size']:
+                            raise UploadError('上传的数据超过了声明的文件大小')
+                        f.write(chunk)
+                        digest.update(chunk)
+                        current += len(chunk)
+            finally:
+                # 连接中断时已写入的部分同样有效，哈希状态与文件大小保持一致
+                if os.path.getsize(self._part_path(upload_id)) == current:
+                    self._hashes[upload_id] = (current, digest)
+                else:
+                    self._hashes.pop(upload_id, None)
+
+            meta['offset'] = current
+            return meta
+
+    def complete(self, upload_id, target_path):
+        """完成上传，把数据文件移动到目标位置
+
+        Args:
+            upload_id: 上传ID
+            target_path: 目标文件路径
+
+        Returns:
+            dict: 上传信息，audio_hash 为文件内容的SHA-256哈希
+
+        Raises:
+            KeyError: 上传不存在
+            UploadError: 文件还没有上传完
+        """
+        with self._upload_lock(upload_id):
+            meta = self.status(upload_id)
+            if meta['offset'] != meta['size']:
+                raise UploadError('文件还没有上传完成')
+
+            meta['audio_hash'] = self._hash_state(upload_id, meta['offset']).hexdigest()
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            os.replace(self._part_path(upload_id), target_path)
+            os.remove(self._meta_path(upload_id))
+            self._hashes.pop(upload_id, None)
+
+        with self._lock:
+            self._locks.pop(upload_id, None)
+        return meta
+
+    def restore(self, upload_id, target_path, meta):
+        """撤销 complete，把文件移回未完成上传的位置
+
+        完成上传后无法提交分析任务时使用，客户端可以稍后再次请求完成。
+
+        Args:
+            upload_id: 上传ID
+            target_path: complete 时使用的目标文件路径
+            meta: complete 返回的上传信息
+        """
+        with self._upload_lock(upload_id):
+            data = {key: value for key, value in meta.items()
+                    if key not in ('offset', 'audio_hash')}
+            write_atomic(self._meta_path(upload_id),
+                         lambda f: f.write(json.dumps(data).encode('utf-8')))
+            os.replace(target_path, self._part_path(upload_id))
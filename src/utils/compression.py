@@ -0,0 +1,44 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli是可选依赖，没有安装时只提供gzip
+    brotli = None
+
+# 支持的内容编码，按优先顺序排列
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# 各编码的文件后缀
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def compress(data, encoding):
+    """用指定的内容编码压缩数据
+
+    压缩在保存时进行，因此使用最高压缩级别。
+
+    Args:
+        data: 原始字节串
+        encoding: 内容编码('br' 或 'gzip')
+
+    Returns:
+        bytes: 压缩后的字节串
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    if encoding == 'gzip':
+        # 固定mtime，相同的数据总是得到相同的压缩结果
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    raise ValueError(f"不支持的内容编码: {encoding}")
+
+
+def compress_variants(data):
+    """生成数据的所有压缩版本
+
+    Args:
+        data: 原始字节串
+
+    Returns:
+        dict: 内容编码 -> 压缩后的字节串
+    """
+    return {encoding: compress(data, encoding) for encoding in ENCODINGS}
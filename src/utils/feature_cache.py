@@ -0,0 +1,97 @@
+import os
+import shutil
+import numpy as np
+from pathlib import Path
+from src.audio.features import AudioFeatures
+from src.utils.file_handler import write_atomic
+from src.utils.metrics import STORAGE_SECONDS, cache_result
+from config import CACHE_FOLDER, CACHE_MAX_BYTES
+
+
+class FeatureCache:
+    """按音频内容哈希缓存分析特征，重复上传同一首歌时跳过解码和分析
+
+    每个哈希对应一个目录，包含 features.npz 和无损格式转码后的 playback.ogg；
+    谱面由特征和种子确定性地重建，不需要单独缓存。
+    目录的修改时间记录最近一次访问，总大小超过上限时按LRU淘汰。
+    """
+
+    def __init__(self, base_dir=CACHE_FOLDER, max_bytes=CACHE_MAX_BYTES):
+        """初始化缓存
+
+        Args:
+            base_dir: 缓存目录
+            max_bytes: 缓存目录的最大总字节数
+        """
+        self.base_dir = Path(base_dir)
+        self.max_bytes = max_bytes
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_dir(self, audio_hash):
+        """获取哈希对应的缓存目录"""
+        return self.base_dir / audio_hash
+
+    def playback_path(self, audio_hash):
+        """获取哈希对应的播放版本缓存路径(文件不一定存在)，见 write_playback_rendition"""
+        return str(self._entry_dir(audio_hash) / 'playback.ogg')
+
+    def _touch(self, audio_hash):
+        """更新缓存目录的访问时间，用于LRU淘汰"""
+        try:
+            os.utime(self._entry_dir(audio_hash))
+        except FileNotFoundError:
+            pass
+
+    def load_features(self, audio_hash):
+        """加载缓存的音频特征
+
+        Args:
+            audio_hash: 音频内容哈希
+
+        Returns:
+            AudioFeatures: 特征对象，如果没有缓存则返回None
+        """
+        path = self._entry_dir(audio_hash) / 'features.npz'
+        cache_result('features', path.exists())
+        if not path.exists():
+            return None
+
+        with STORAGE_SECONDS.time(operation='load_features'), np.load(path) as data:
+            features = AudioFeatures.from_dict(data)
+        self._touch(audio_hash)
+        return features
+
+    def save_features(self, audio_hash, features):
+        """保存音频特征
+
+        Args:
+            audio_hash: 音频内容哈希
+            features: 特征对象
+        """
+        path = self._entry_dir(audio_hash) / 'features.npz'
+        with STORAGE_SECONDS.time(operation='save_features'):
+            write_atomic(path, lambda f: np.savez(f, **features.to_dict()))
+        self.evict()
+
+    def evict(self):
+        """总大小超过上限时，按最近访问时间淘汰最旧的缓存条目"""
+        entries = []
+        total = 0
+        for entry in self.base_dir.iterdir():
+            if not entry.is_dir():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                # 条目可能正被其他进程淘汰
+                continue
+            entries.append((mtime, size, entry))
+            total += size
+
+        entries.sort(key=lambda item: item[0])
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
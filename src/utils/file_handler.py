@@ -1,8 +1,15 @@
 import os
 import uuid
+import shutil
+import hashlib
+import tempfile
 from werkzeug.utils import secure_filename
 from config import UPLOAD_FOLDER
 
+# 进程的umask，os.umask 只能在设置的同时读取，导入时读取一次
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 def get_upload_path(session_id, filename):
     """获取上传文件的路径
     
@@ -16,6 +23,23 @@ def get_upload_path(session_id, filename):
     session_folder = os.path.join(UPLOAD_FOLDER, session_id)
     return os.path.join(session_folder, filename)
 
+def safe_filename(filename):
+    """获取可以安全保存的文件名
+    
+    Args:
+        filename: 客户端提供的原始文件名
+        
+    Returns:
+        str: 安全的文件名
+    """
+    safe = secure_filename(filename)
+    
+    # 如果文件名不合法，使用随机生成的UUID作为文件名
+    if not safe:
+        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'audio'
+        safe = f"{uuid.uuid4().hex}.{ext}"
+    return safe
+
 def save_uploaded_file(file, session_id):
     """保存上传的文件
     
@@ -31,12 +55,7 @@ def save_uploaded_file(file, session_id):
     os.makedirs(session_folder, exist_ok=True)
     
     # 安全处理文件名
-    filename = secure_filename(file.filename)
-    
-    # 如果文件名不合法，使用随机生成的UUID作为文件名
-    if not filename:
-        ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'audio'
-        filename = f"{uuid.uuid4().hex}.{ext}"
+    filename = safe_filename(file.filename)
     
     # 保存文件
     file_path = os.path.join(session_folder, filename)
@@ -44,6 +63,75 @@ def save_uploaded_file(file, session_id):
     
     return filename
 
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256哈希，用作内容寻址缓存的键
+    
+    Args:
+        file_path: 文件路径
+        chunk_size: 每次读取的字节数
+        
+    Returns:
+        str: 十六进制哈希字符串
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_atomic(path, write):
+    """先写入同目录下的临时文件再重命名，避免并发读取到写了一半的文件
+    
+    Args:
+        path: 目标文件路径
+        write: 接收二进制文件对象的写入函数
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        # mkstemp 创建的文件只有所有者可读写，改为与普通新建文件相同的权限，
+        # 以其他用户运行的前端服务器才能读取 static 中的文件
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def link_atomic(source, path):
+    """把已有文件链接到目标路径，不在同一文件系统时复制，目标文件原子地出现
+    
+    两个路径共享同一份数据，只能用于不会被原地修改的文件(例如由 write_atomic 写入的文件)。
+    
+    Args:
+        source: 已有文件路径
+        path: 目标文件路径
+        
+    Raises:
+        FileNotFoundError: 源文件不存在
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{uuid.uuid4().hex}.tmp")
+    try:
+        os.link(source, tmp_path)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # 不同文件系统之间不能建立硬链接
+        with open(source, 'rb') as src:
+            write_atomic(path, lambda f: shutil.copyfileobj(src, f))
+        return
+    
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
 def clean_old_files(max_age=24*60*60):
     """清理过期的文件
     
@@ -0,0 +1,302 @@
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from src.utils import metrics
+from config import ANALYSIS_WORKERS, JOB_QUEUE_SIZE, JOB_RETENTION
+
+
+class JobQueueError(RuntimeError):
+    """任务无法提交时抛出，调用方可以稍后重试"""
+
+
+class QueueFullError(JobQueueError):
+    """任务队列已满时抛出"""
+
+
+class WorkerPoolError(JobQueueError):
+    """进程池损坏且重建后仍无法提交任务时抛出"""
+
+
+class JobFailedError(Exception):
+    """任务函数在分析进程中抛出异常时，代替原异常返回给Web进程
+
+    携带任务失败前记录的指标操作，消息与原异常相同。
+    """
+
+    def __init__(self, message, collected):
+        super().__init__(message, collected)
+        self.collected = collected
+
+    def __str__(self):
+        return self.args[0]
+
+
+def _run_job(job_id, progress_store, func, args):
+    """在分析进程中执行任务，并把进度写回共享字典
+
+    Args:
+        job_id: 任务ID
+        progress_store: 进程间共享的进度字典
+        func: 任务函数，需要接受 progress 关键字参数
+        args: 任务函数的位置参数
+
+    Returns:
+        tuple: (任务函数的返回值, 任务中记录的指标操作)
+
+    Raises:
+        JobFailedError: 任务函数抛出异常，异常中同样带有已经记录的指标操作
+    """
+    def report(stage, value):
+        progress_store[job_id] = {'stage': stage, 'progress': float(value)}
+
+    report('running', 0.0)
+    # 分析进程中的指标无法被Web进程导出，随结果一起返回
+    with metrics.collect() as collected:
+        try:
+            result = func(*args, progress=report)
+        except Exception as e:
+            # 失败前记录的阶段耗时和失败计数(例如解码失败)同样需要交给Web进程
+            raise JobFailedError(str(e), collected) from e
+    return result, collected
+
+
+def _noop():
+    """空任务，用于提前启动分析进程"""
+
+
+class JobQueue:
+    """后台任务队列，使用进程池在请求线程之外执行音频分析"""
+
+    def __init__(self, max_workers=ANALYSIS_WORKERS, max_pending=JOB_QUEUE_SIZE,
+                 retention=JOB_RETENTION, initializer=None):
+        """初始化任务队列
+
+        Args:
+            max_workers: 分析进程数量
+            max_pending: 最多同时排队或运行的任务数
+            retention: 已完成任务的状态保留时间(秒)
+            initializer: 每个分析进程启动时执行的模块级函数(例如预热)
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.initializer = initializer
+        self._prewarmed = False
+        self._executor = None
+        self._manager = None
+        self._progress = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _create_executor(self):
+        """创建进程池，使用spawn启动，避免在多线程的Web进程中fork"""
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=self.initializer
+        )
+
+    def _ensure_executor(self):
+        """按需创建进程池，避免在导入时就启动子进程
+
+        Raises:
+            WorkerPoolError: 保存共享进度的Manager进程无法启动(例如进程数或内存达到上限)
+        """
+        if self._executor is None:
+            try:
+                self._manager = multiprocessing.get_context('spawn').Manager()
+            except (OSError, EOFError) as e:
+                raise WorkerPoolError('分析进程不可用，请稍后再试') from e
+            self._progress = self._manager.dict()
+            self._executor = self._create_executor()
+
+    def _submit_to_executor(self, func, *args):
+        """向进程池提交任务，进程池损坏时重建一次后重试，调用方需持有锁
+
+        分析进程被系统杀死(例如内存不足)或异常退出后，进程池会拒绝所有新任务。
+
+        Raises:
+            WorkerPoolError: 重建后仍然无法提交
+        """
+        self._ensure_executor()
+        try:
+            return self._executor.submit(func, *args)
+        except BrokenProcessPool:
+            # 已提交的任务会以 BrokenProcessPool 失败；共享进度字典所在的Manager进程不受影响，只替换进程池
+            self._executor.shutdown(wait=False)
+            self._executor = self._create_executor()
+        try:
+            return self._executor.submit(func, *args)
+        except (BrokenProcessPool, RuntimeError) as e:
+            raise WorkerPoolError('分析进程不可用，请稍后再试') from e
+
+    def prewarm(self, background=False):
+        """提前启动所有分析进程并执行初始化函数
+
+        进程池在没有空闲进程时才会启动新进程，提交与进程数相同的空任务即可全部启动，
+        第一个真正的任务不用再等待进程启动和预热。重复调用不会再次启动。
+
+        Args:
+            background: 是否在后台线程中启动，不阻塞调用方(例如正在处理的请求)
+        """
+        with self._lock:
+            if self._prewarmed:
+                return
+            self._prewarmed = True
+        if background:
+            threading.Thread(target=self._start_workers, name='job-queue-prewarm', daemon=True).start()
+        else:
+            self._start_workers()
+
+    def _start_workers(self):
+        """创建进程池并提交空任务启动所有分析进程，失败时允许再次预热"""
+        try:
+            with self._lock:
+                for _ in range(self.max_workers):
+                    self._submit_to_executor(_noop)
+        except JobQueueError:
+            self._prewarmed = False
+            raise
+
+    def _pending_count(self):
+        """统计尚未完成的任务数量"""
+        return sum(1 for job in self._jobs.values() if not job['future'].done())
+
+    def _prune(self):
+        """清理超过保留时间的已完成任务"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['finished_at'] is not None and now - job['finished_at'] > self.retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+            self._progress.pop(job_id, None)
+
+    def submit(self, func, *args, **meta):
+        """提交一个任务
+
+        Args:
+            func: 任务函数，必须是可被pickle的模块级函数
+            *args: 任务函数的位置参数
+            **meta: 附加在任务状态中的信息(例如session_id)
+
+        Returns:
+            str: 任务ID
+
+        Raises:
+            QueueFullError: 排队任务数已达上限
+            WorkerPoolError: 分析进程不可用
+        """
+        with self._lock:
+            self._ensure_executor()
+            self._prune()
+            if self._pending_count() >= self.max_pending:
+                raise QueueFullError('分析任务队列已满，请稍后再试')
+
+            job_id = uuid.uuid4().hex
+            # 提交成功后才记录任务，_jobs 中的任务总是有 future
+            future = self._submit_to_executor(_run_job, job_id, self._progress, func, args)
+            self._jobs[job_id] = {
+                'id': job_id,
+                'meta': meta,
+                'created_at': time.time(),
+                'finished_at': None,
+                'future': future
+            }
+            metrics.ANALYSES_IN_FLIGHT.inc()
+
+        future.add_done_callback(lambda _: self._mark_finished(job_id))
+        return job_id
+
+    def _mark_finished(self, job_id):
+        """记录任务完成时间，并把分析进程中记录的指标合并到当前进程"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job['finished_at'] = time.time()
+            future = job['future'] if job is not None else None
+        metrics.ANALYSES_IN_FLIGHT.dec()
+
+        if future is None or future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            metrics.replay(future.result()[1])
+            return
+        metrics.FAILURES.inc(operation='analysis')
+        if isinstance(error, JobFailedError):
+            metrics.replay(error.collected)
+
+    def get(self, job_id):
+        """获取任务状态
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            dict: 任务状态字典，如果任务不存在则返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            future = job['future']
+            progress = dict(self._progress.get(job_id, {}))
+
+        status = {
+            'id': job_id,
+            'status': 'queued',
+            'stage': progress.get('stage', 'queued'),
+            'progress': progress.get('progress', 0.0),
+            'created_at': job['created_at'],
+            'finished_at': job['finished_at']
+        }
+        status.update(job['meta'])
+
+        if future.done():
+            error = future.exception()
+            if error is not None:
+                status['status'] = 'failed'
+                status['error'] = str(error)
+            else:
+                status['status'] = 'done'
+                status['stage'] = 'done'
+                status['progress'] = 1.0
+                status['result'] = future.result()[0]
+        elif progress:
+            status['status'] = 'running'
+
+        return status
+
+    def wait(self, job_id, timeout=None):
+        """等待任务完成
+
+        Args:
+            job_id: 任务ID
+            timeout: 最长等待时间(秒)，None表示一直等待
+
+        Returns:
+            dict: 等待结束时的任务状态，如果任务不存在则返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        wait_futures([job['future']], timeout=timeout)
+        return self.get(job_id)
+
+    def shutdown(self, wait=True):
+        """关闭进程池
+
+        Args:
+            wait: 是否等待正在运行的任务结束
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._manager.shutdown()
+            self._executor = None
+            self._manager = None
+            self._prewarmed = False
@@ -0,0 +1,311 @@
+"""进程内的运行指标，按Prometheus文本格式导出
+
+分析任务在独立的进程中运行，其中记录的指标不会出现在Web进程里。
+任务函数在 collect() 中执行时，计数和耗时会同时被收集下来，随任务结果
+返回给Web进程，再由 replay() 记录到Web进程的指标中。
+"""
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+# Prometheus文本格式的Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 请求耗时的直方图分桶(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 分析阶段耗时的直方图分桶(秒)，长音频的单个阶段可能需要几分钟
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+_local = threading.local()
+
+
+def _collecting():
+    """当前线程正在使用的收集列表，不在 collect() 中时返回None"""
+    return getattr(_local, 'collected', None)
+
+
+def _escape(value):
+    """转义标签值中的反斜杠、双引号和换行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    """格式化标签，例如 {stage="stft",le="0.5"}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    """格式化样本值，整数不带小数点"""
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类，按标签值分别保存数据"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """初始化指标
+
+        Args:
+            name: 指标名称
+            documentation: 指标说明
+            labelnames: 标签名称列表
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        """把标签字典转换为按 labelnames 排列的标签值元组"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要的标签为 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _forward(self, method, value, labels):
+        """在 collect() 中时记录这次操作，以便在其他进程中重放"""
+        collected = _collecting()
+        if collected is not None:
+            collected.append((self.name, method, value, labels))
+
+    def samples(self):
+        """生成 (样本名, 标签字符串, 值) 序列"""
+        raise NotImplementedError
+
+    def render(self):
+        """按Prometheus文本格式输出
+
+        Returns:
+            str: 包含HELP和TYPE注释的文本
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """增加计数
+
+        Args:
+            amount: 增加的数量
+            **labels: 标签值
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._forward('inc', amount, labels)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if not values and not self.labelnames:
+            values[()] = 0
+        for key, value in sorted(values.items()):
+            yield f"{self.name}_total", _format_labels(self.labelnames, key), value
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        """增加当前值"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """减少当前值"""
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        """设置当前值"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if not values and not self.labelnames:
+            values[()] = 0
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram(_Metric):
+    """按分桶统计观测值的直方图，同时记录总和与次数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """初始化直方图
+
+        Args:
+            name: 指标名称
+            documentation: 指标说明
+            labelnames: 标签名称列表
+            buckets: 分桶上界(升序)，会自动加上 +Inf
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        """记录一个观测值
+
+        Args:
+            value: 观测值(例如耗时秒数)
+            **labels: 标签值
+        """
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+        self._forward('observe', value, labels)
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 语句块的耗时(秒)，语句块抛出异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == math.inf else _format_value(bound)
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, ('le', le)), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), count
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标 {metric.name} 已经存在")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """创建并注册计数器"""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        """创建并注册当前值指标"""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """创建并注册直方图"""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        """按名称获取指标，不存在时返回None"""
+        return self._metrics.get(name)
+
+    def render(self):
+        """按Prometheus文本格式输出所有指标
+
+        Returns:
+            str: 指标文本
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'algorhythm_analysis_stage_seconds', '音频分析和谱面生成各阶段的耗时',
+    ['stage'], buckets=STAGE_BUCKETS)
+STORAGE_SECONDS = REGISTRY.histogram(
+    'algorhythm_storage_seconds', '谱面和特征存储的读写耗时', ['operation'])
+REQUEST_SECONDS = REGISTRY.histogram(
+    'algorhythm_http_request_seconds', 'HTTP请求的处理耗时', ['route', 'method', 'status'])
+UPLOADS = REGISTRY.counter(
+    'algorhythm_uploads', '完成的音频上传次数', ['kind'])
+CACHE_REQUESTS = REGISTRY.counter(
+    'algorhythm_cache_requests', '缓存查询次数', ['cache', 'result'])
+FAILURES = REGISTRY.counter(
+    'algorhythm_failures', '各类操作的失败次数', ['operation'])
+ANALYSES_IN_FLIGHT = REGISTRY.gauge(
+    'algorhythm_analyses_in_flight', '排队或正在运行的分析任务数')
+
+
+def cache_result(cache, hit):
+    """记录一次缓存查询的命中情况
+
+    Args:
+        cache: 缓存名称
+        hit: 是否命中
+    """
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+@contextmanager
+def collect():
+    """收集 with 语句块中所有的计数和观测操作
+
+    Yields:
+        list: 收集到的操作，可以被pickle后交给 replay 在其他进程中重放
+    """
+    previous = _collecting()
+    collected = []
+    _local.collected = collected
+    try:
+        yield collected
+    finally:
+        _local.collected = previous
+        if previous is not None:
+            previous.extend(collected)
+
+
+def replay(collected, registry=REGISTRY):
+    """在当前进程中重放其他进程收集到的操作
+
+    Args:
+        collected: collect() 收集到的操作列表
+        registry: 指标注册表
+    """
+    for name, method, value, labels in collected:
+        metric = registry.get(name)
+        if metric is not None:
+            getattr(metric, method)(value, **labels)
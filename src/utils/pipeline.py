@@ -0,0 +1,180 @@
+import hashlib
+from functools import lru_cache
+from src.audio.playback import write_playback_rendition
+from src.chart.generator import ChartGenerator, GENERATOR_VERSION
+from src.utils.chart_storage import ChartStorage, shared_chart_id
+from src.utils.feature_cache import FeatureCache
+from src.utils.file_handler import hash_file
+from src.utils.metrics import STAGE_SECONDS
+from config import DIFFICULTY_LEVELS, CHART_CACHE_SIZE
+
+
+class _FeaturesMissing(LookupError):
+    """特征不在缓存中时由 _build_chart 抛出，异常不会被 lru_cache 缓存"""
+
+
+def _noop_progress(stage, value):
+    """默认的进度回调，什么都不做"""
+
+
+def chart_seed(feature_hash, difficulty):
+    """由特征哈希和难度推导谱面的随机种子，同一首歌同一难度的谱面总是相同
+
+    Args:
+        feature_hash: 音频内容哈希
+        difficulty: 难度级别
+
+    Returns:
+        int: 64位随机种子
+    """
+    digest = hashlib.sha256(f"{feature_hash}:{difficulty}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def make_chart_ref(feature_hash, difficulty):
+    """创建谱面引用，它能唯一确定并重建一张谱面
+
+    Args:
+        feature_hash: 音频内容哈希
+        difficulty: 难度级别
+
+    Returns:
+        dict: 谱面引用字典
+    """
+    return {
+        'feature_hash': feature_hash,
+        'difficulty': difficulty,
+        'seed': chart_seed(feature_hash, difficulty),
+        'generator_version': GENERATOR_VERSION
+    }
+
+
+def generate_chart_data(features, feature_hash, difficulty):
+    """用确定的种子生成谱面，同一首歌同一难度在任何进程中生成的谱面都相同
+
+    Args:
+        features: 音频特征
+        feature_hash: 音频内容哈希
+        difficulty: 难度级别
+
+    Returns:
+        dict: 谱面数据字典
+    """
+    with STAGE_SECONDS.time(stage='generate_chart'):
+        chart = ChartGenerator(features, difficulty=difficulty,
+                               seed=chart_seed(feature_hash, difficulty)).generate_chart()
+    return chart.to_dict()
+
+
+@lru_cache(maxsize=CHART_CACHE_SIZE)
+def _build_chart(feature_hash, difficulty, seed, generator_version):
+    """由缓存的特征重建谱面，最近使用的谱面保留在内存中
+
+    返回的字典会被多个请求共享，调用方不能修改它。
+    特征不在缓存中时抛出 _FeaturesMissing 而不是返回None，避免缓存未命中的结果。
+    """
+    features = FeatureCache().load_features(feature_hash)
+    if features is None:
+        raise _FeaturesMissing(feature_hash)
+    return generate_chart_data(features, feature_hash, difficulty)
+
+
+def regenerate_chart(chart_ref):
+    """根据谱面引用重建谱面数据，作为 ChartStorage 的 chart_resolver
+
+    分析进程已经为每首歌保存了完整的谱面，只有共享的谱面文件不存在时(例如生成器升级后)
+    才会调用，使用当前版本的生成器由缓存的特征重新生成。
+    这里在Web进程中执行，不会重新分析音频。
+
+    Args:
+        chart_ref: 谱面引用字典
+
+    Returns:
+        dict: 谱面数据字典，如果特征已被缓存淘汰则返回None
+    """
+    try:
+        return _build_chart(chart_ref['feature_hash'], chart_ref['difficulty'],
+                            chart_ref['seed'], GENERATOR_VERSION)
+    except _FeaturesMissing:
+        return None
+
+
+def save_shared_charts(storage, features, feature_hash, difficulties=DIFFICULTY_LEVELS):
+    """为一首歌保存所有难度的完整谱面(含二进制格式和预压缩版本)，已经存在的难度跳过
+
+    谱面保存在 shared_chart_id 下，所有上传了同一首歌的会话共享，
+    读取和发送谱面时都不需要再生成或压缩。
+
+    Args:
+        storage: ChartStorage 对象
+        features: 音频特征
+        feature_hash: 音频内容哈希
+        difficulties: 难度列表
+
+    Returns:
+        dict: 难度 -> 新生成谱面的音符数量，跳过的难度不包含在内
+    """
+    chart_id = shared_chart_id(feature_hash)
+    notes = {}
+    for difficulty in difficulties:
+        if storage.has_chart(chart_id, difficulty):
+            continue
+        chart_data = generate_chart_data(features, feature_hash, difficulty)
+        storage.save_chart(chart_id, chart_data, difficulty)
+        notes[difficulty] = len(chart_data['notes'])
+    return notes
+
+
+def process_audio(audio_path, session_id, audio_hash=None, progress=None):
+    """分析音频并保存所有难度的谱面，在后台分析进程中执行
+
+    谱面按内容哈希共享保存(见 save_shared_charts)，会话只保存指向它的引用。
+
+    Args:
+        audio_path: 音频文件路径
+        session_id: 会话ID
+        audio_hash: 已知的音频内容哈希(例如分块上传时增量计算的)，None表示读取文件计算
+        progress: 进度回调函数 progress(stage, value)，value为0-1之间的进度
+
+    Returns:
+        dict: 任务结果摘要
+    """
+    report = progress or _noop_progress
+    cache = FeatureCache()
+    storage = ChartStorage()
+
+    # 1. 按内容哈希查找缓存，重复上传的歌曲直接复用已有特征
+    if audio_hash is None:
+        report('hashing', 0.01)
+        with STAGE_SECONDS.time(stage='hash'):
+            audio_hash = hash_file(audio_path)
+    features = cache.load_features(audio_hash)
+    cached = features is not None
+
+    # 2. 解码并分析音频(特征已缓存时跳过)
+    if not cached:
+        # 只在分析进程中加载librosa，Web进程导入本模块时不需要它
+        from src.audio.analyzer import create_analyzer
+
+        report('analyzing', 0.05)
+        analyzer = create_analyzer(audio_path)
+        features = analyzer.extract_features()
+        cache.save_features(audio_hash, features)
+
+    # 3. 为浏览器播放生成压缩的音频版本(无损格式才需要转码)，重复上传直接复用缓存的版本
+    report('transcoding', 0.9)
+    rendition = write_playback_rendition(audio_path, cache.playback_path(audio_hash))
+
+    # 4. 生成并压缩所有难度的谱面(同一首歌已有的谱面直接复用)，会话只保存引用
+    report('saving', 0.95)
+    save_shared_charts(storage, features, audio_hash)
+    for difficulty in DIFFICULTY_LEVELS:
+        storage.save_chart_ref(session_id, make_chart_ref(audio_hash, difficulty), difficulty)
+
+    return {
+        'session_id': session_id,
+        'audio_hash': audio_hash,
+        'cached': cached,
+        'playback_transcoded': rendition is not None,
+        'duration': float(features.duration)
+    }
@@ -14,7 +14,8 @@ class RhythmGame {
             audioPath: null,  // 音频文件路径
             chartData: null,  // 谱面数据
             judgeLine: 100,   // 判定线位置(距底部像素)
-            offset: 0         // 音频偏移(毫秒)
+            offset: 0,        // 音频偏移(毫秒)
+            frameBudget: 1000 / 60  // 每帧的时间预算(毫秒)
         }, config);
         
         // 计算实际音符下落速度（根据BPM调整）
@@ -41,6 +42,13 @@ class RhythmGame {
         this.activeNotes = [];
         this.processedNotes = new Set();
         
+        // 按时间排序的音符窗口：windowEnd 之前的音符已经进入画面，missCursor 之前的音符已经判定过Miss
+        this.windowEnd = 0;
+        this.missCursor = 0;
+        this.visibleNotes = new Map();  // 音符 -> 音符元素
+        this.notePool = [];  // 可复用的音符元素
+        this.frameStats = this._emptyFrameStats();
+        
         // 初始化DOM元素
         this.container = document.getElementById(this.config.containerId);
         this.scoreDisplay = document.getElementById('score-display');
@@ -114,6 +122,8 @@ class RhythmGame {
             lane.appendChild(hitArea);
         }
         
+        this.laneElements = Array.from(lanesContainer.children);
+        
         // 创建判定线
         const judgeLine = document.createElement('div');
         judgeLine.className = 'judge-line';
@@ -202,6 +212,8 @@ class RhythmGame {
      */
     _loadChart(chartData) {
         this.chart = chartData;
+        // 音符窗口依赖按时间排序的音符列表
+        this.chart.notes.sort((a, b) => a.time - b.time);
         console.log('谱面加载成功:', this.chart);
     }
     
@@ -367,11 +379,8 @@ class RhythmGame {
         // 更新显示
         this._updateDisplay();
         
-        // 移除音符元素
-        const noteElement = document.getElementById(`note-${note.id}`);
-        if (noteElement) {
-            noteElement.remove();
-        }
+        // 回收音符元素
+        this._releaseNote(note);
     }
     
     /**
@@ -459,6 +468,8 @@ class RhythmGame {
     _gameLoop(timestamp) {
         if (!this.isPlaying || this.isPaused) return;
         
+        const frameStart = performance.now();
+        
         // 使用音频当前时间作为游戏时间基准
         this.currentTime = this.audioElement.currentTime;
         
@@ -468,121 +479,222 @@ class RhythmGame {
         // 检查Miss的音符
         this._checkMissedNotes();
         
+        this._recordFrame(timestamp, performance.now() - frameStart);
+        
         // 请求下一帧
         this.animationFrameId = requestAnimationFrame(this._gameLoop.bind(this));
     }
     
+    /**
+     * 创建空的帧时间统计
+     * @private
+     * @returns {Object} 帧时间统计
+     */
+    _emptyFrameStats() {
+        return {
+            frames: 0,         // 统计的帧数
+            overBudget: 0,     // 单帧更新耗时超过预算的帧数
+            droppedFrames: 0,  // 与上一帧间隔超过1.5倍预算的帧数(掉帧)
+            totalWorkMs: 0,    // 更新音符的总耗时
+            maxWorkMs: 0       // 单帧更新的最大耗时
+        };
+    }
+    
+    /**
+     * 记录一帧的耗时
+     * @param {number} timestamp 本帧的时间戳
+     * @param {number} workMs 本帧更新音符的耗时(毫秒)
+     * @private
+     */
+    _recordFrame(timestamp, workMs) {
+        const stats = this.frameStats;
+        const budget = this.config.frameBudget;
+        
+        stats.frames++;
+        stats.totalWorkMs += workMs;
+        stats.maxWorkMs = Math.max(stats.maxWorkMs, workMs);
+        if (workMs > budget) {
+            stats.overBudget++;
+        }
+        if (stats.frames > 1 && timestamp - this.lastFrameTime > budget * 1.5) {
+            stats.droppedFrames++;
+        }
+        this.lastFrameTime = timestamp;
+    }
+    
+    /**
+     * 获取帧时间统计
+     * @returns {Object} 帧数、超出预算和掉帧的次数、平均和最大更新耗时(毫秒)
+     */
+    getFrameStats() {
+        const stats = this.frameStats;
+        return Object.assign({}, stats, {
+            budgetMs: this.config.frameBudget,
+            avgWorkMs: stats.frames ? stats.totalWorkMs / stats.frames : 0
+        });
+    }
+    
+    /**
+     * 判断是否为带尾部的长音符
+     * @param {Object} note 音符对象
+     * @private
+     * @returns {boolean}
+     */
+    _isLongNote(note) {
+        return (note.type === 'hold' || note.type === 'slide') && note.duration > 0;
+    }
+    
+    /**
+     * 从元素池中取出一个音符元素并设置为音符的样式
+     * @param {Object} note 音符对象
+     * @private
+     * @returns {HTMLElement} 音符元素
+     */
+    _acquireNote(note) {
+        let noteElement = this.notePool.pop();
+        if (!noteElement) {
+            noteElement = document.createElement('div');
+            noteElement.appendChild(document.createElement('div')).className = 'note-tail';
+            // 位置只通过transform更新
+            noteElement.style.top = '0';
+            noteElement.style.left = '50%';
+        }
+        noteElement.className = `note ${note.type}`;
+        
+        // 根据音符强度调整大小和亮度
+        noteElement.noteScale = 1 + note.intensity * 0.2;  // 强音符略大
+        noteElement.style.filter = `brightness(${100 + note.intensity * 50}%)`;  // 强音符更亮
+        
+        // 处理长音符，根据BPM调整尾部长度
+        const tail = noteElement.firstChild;
+        if (this._isLongNote(note)) {
+            tail.style.height = `${note.duration * this.noteSpeed}px`;
+            tail.style.display = '';
+        } else {
+            tail.style.display = 'none';
+        }
+        
+        // 将音符放到对应的轨道中
+        const lane = this.laneElements[note.lane];
+        if (lane && noteElement.parentNode !== lane) {
+            lane.appendChild(noteElement);
+        }
+        noteElement.style.display = '';
+        
+        this.visibleNotes.set(note, noteElement);
+        return noteElement;
+    }
+    
+    /**
+     * 隐藏音符元素并放回元素池
+     * @param {Object} note 音符对象
+     * @private
+     */
+    _releaseNote(note) {
+        const noteElement = this.visibleNotes.get(note);
+        if (!noteElement) return;
+        
+        noteElement.style.display = 'none';
+        this.visibleNotes.delete(note);
+        this.notePool.push(noteElement);
+    }
+    
+    /**
+     * 回收所有音符元素并把音符窗口重置到谱面开头
+     * @private
+     */
+    _resetNoteWindow() {
+        for (const note of Array.from(this.visibleNotes.keys())) {
+            this._releaseNote(note);
+        }
+        this.activeNotes = [];
+        this.windowEnd = 0;
+        this.missCursor = 0;
+    }
+    
     /**
      * 更新音符位置
+     * 
+     * 音符按时间排序，windowEnd 只向前移动，每帧只处理画面中的音符，
+     * 开销与谱面长度无关。音符元素从元素池中复用，位置只通过transform更新。
      * @private
      */
     _updateNotes() {
-        // 更新活动音符列表
-        this.activeNotes = this.chart.notes.filter(note => {
+        const notes = this.chart.notes;
+        const height = this.container.clientHeight;
+        // 根据BPM动态调整预显示时间
+        const previewTime = Math.min(4, (height - this.config.judgeLine) / this.noteSpeed);
+        
+        // 进入预显示时间的音符加入画面
+        while (this.windowEnd < notes.length && notes[this.windowEnd].time - this.currentTime <= previewTime) {
+            const note = notes[this.windowEnd++];
+            if (!this.processedNotes.has(note.id)) {
+                this._acquireNote(note);
+            }
+        }
+        
+        // 更新画面中的音符，移除已经完全离开画面的音符
+        this.activeNotes = [];
+        for (const [note, noteElement] of this.visibleNotes) {
             const timeToHit = note.time - this.currentTime;
-            // 根据BPM动态调整预显示时间
-            const previewTime = Math.min(4, (this.container.clientHeight - this.config.judgeLine) / this.noteSpeed);
             
             // 计算音符完全消失的时间点
             let disappearTime = -0.5;  // 基础消失时间
             
             // 如果是长音符，考虑尾部长度
-            if ((note.type === 'hold' || note.type === 'slide') && note.duration > 0) {
+            if (this._isLongNote(note)) {
                 // 计算尾部完全消失所需的额外时间
-                const tailDisappearTime = note.duration + (this.config.judgeLine / this.noteSpeed);
-                disappearTime -= tailDisappearTime;
+                disappearTime -= note.duration + (this.config.judgeLine / this.noteSpeed);
             }
             
-            return timeToHit >= disappearTime && timeToHit <= previewTime;
-        });
-        
-        // 为每个音符添加唯一ID
-        this.activeNotes.forEach(note => {
-            if (!note.id) {
-                note.id = `${note.time}-${note.lane}`;
-            }
-        });
-        
-        // 清除不在活动列表中的音符元素
-        const noteElements = document.querySelectorAll('.note');
-        noteElements.forEach(el => {
-            const noteId = el.id.replace('note-', '');
-            if (!this.activeNotes.some(note => note.id === noteId)) {
-                el.remove();
+            if (timeToHit < disappearTime) {
+                this._releaseNote(note);
+                continue;
             }
-        });
-        
-        // 渲染活动音符
-        this.activeNotes.forEach(note => {
-            if (this.processedNotes.has(note.id)) return;
-            
-            // 计算音符位置，考虑音符强度影响视觉效果
-            const timeToHit = note.time - this.currentTime;
-            const distance = timeToHit * this.noteSpeed;
-            const yPosition = this.container.clientHeight - this.config.judgeLine - distance;
-            
-            let noteElement = document.getElementById(`note-${note.id}`);
+            this.activeNotes.push(note);
             
-            if (!noteElement) {
-                noteElement = document.createElement('div');
-                noteElement.id = `note-${note.id}`;
-                noteElement.className = `note ${note.type}`;
-                
-                // 根据音符强度调整大小和亮度
-                const scale = 1 + note.intensity * 0.2;  // 强音符略大
-                const brightness = 100 + note.intensity * 50;  // 强音符更亮
-                noteElement.style.transform = `translate(-50%, -50%) scale(${scale})`;
-                noteElement.style.filter = `brightness(${brightness}%)`;
-                
-                // 处理长音符
-                if ((note.type === 'hold' || note.type === 'slide') && note.duration > 0) {
-                    const tail = document.createElement('div');
-                    tail.className = 'note-tail';
-                    // 根据BPM调整尾部长度
-                    const tailHeight = note.duration * this.noteSpeed;
-                    tail.style.height = `${tailHeight}px`;
-                    noteElement.appendChild(tail);
-                }
-                
-                // 将音符添加到对应的轨道中
-                const lane = document.querySelector(`.game-lane:nth-child(${note.lane + 1})`);
-                if (lane) {
-                    lane.appendChild(noteElement);
-                }
-            }
-            
-            // 更新音符位置（现在只需要更新垂直位置）
-            noteElement.style.top = `${yPosition}px`;
-            noteElement.style.left = '50%';  // 在轨道中水平居中
-        });
+            // 计算音符位置（只需要更新垂直位置）
+            const yPosition = height - this.config.judgeLine - timeToHit * this.noteSpeed;
+            noteElement.style.transform =
+                `translate3d(0, ${yPosition}px, 0) translate(-50%, -50%) scale(${noteElement.noteScale})`;
+        }
     }
     
     /**
      * 检查是否有错过的音符
+     * 
+     * missCursor 之前的音符都已经判定过，每帧只检查刚刚超过判定时间的音符。
      * @private
      */
     _checkMissedNotes() {
         const missThreshold = 0.2; // 200毫秒
+        const notes = this.chart.notes;
         
-        this.chart.notes.forEach(note => {
+        // 如果音符已经过了判定点太久
+        while (this.missCursor < notes.length && this.currentTime - notes[this.missCursor].time > missThreshold) {
+            const note = notes[this.missCursor++];
             // 跳过已处理的音符
-            if (this.processedNotes.has(note.id)) return;
+            if (this.processedNotes.has(note.id)) continue;
             
-            // 如果音符已经过了判定点太久
-            const timePassed = this.currentTime - note.time;
-            if (timePassed > missThreshold) {
-                this.processedNotes.add(note.id);
-                this.judgeResults.miss++;
-                this.combo = 0;
-                this._updateDisplay();
-                
-                // 移除音符元素
-                const noteElement = document.getElementById(`note-${note.id}`);
-                if (noteElement) {
-                    noteElement.remove();
-                }
-            }
-        });
+            this.processedNotes.add(note.id);
+            this.judgeResults.miss++;
+            this.combo = 0;
+            this._updateDisplay();
+            
+            // 回收音符元素
+            this._releaseNote(note);
+        }
+    }
+    
+    /**
+     * 切换谱面(例如切换难度)，会停止当前游戏
+     * @param {Object} chartData 谱面数据
+     */
+    setChart(chartData) {
+        this.stop();
+        this._resetNoteWindow();
+        this._loadChart(chartData);
+        this.noteSpeed = this._calculateNoteSpeed();
     }
     
     /**
@@ -625,6 +737,8 @@ class RhythmGame {
             miss: 0
         };
         this.processedNotes = new Set();
+        this._resetNoteWindow();
+        this.frameStats = this._emptyFrameStats();
         
         // 隐藏结果界面
         const resultScreen = document.getElementById('result-screen');
@@ -690,6 +804,9 @@ class RhythmGame {
         }
         
         console.log('游戏结束');
+        if (this.frameStats.frames) {
+            console.log('帧时间统计:', this.getFrameStats());
+        }
     }
     
     /**
@@ -697,19 +814,140 @@ class RhythmGame {
      */
     restart() {
         this.stop();
-        this.container.querySelectorAll('.note').forEach(el => el.remove());
+        this._resetNoteWindow();
         this.start();
     }
 }
 
+// 二进制谱面格式，与 src/chart/codec.py 保持一致
+const CHART_BINARY_MIMETYPE = 'application/x-algorhythm-chart';
+const NOTE_TYPES = ['tap', 'hold', 'slide'];  // 与 config.NOTE_TYPES 顺序一致
+
+/**
+ * 解码二进制谱面
+ * @param {ArrayBuffer} buffer 二进制谱面数据
+ * @returns {Object} 与JSON格式相同的谱面数据
+ */
+function decodeBinaryChart(buffer) {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    
+    const magic = String.fromCharCode(...bytes.subarray(0, 4));
+    if (magic !== 'ARCH' || view.getUint8(4) !== 1) {
+        throw new Error('不支持的谱面格式');
+    }
+    const difficultyLength = view.getUint8(5);
+    const timeUnit = view.getUint16(6, true) / 1e6;
+    const tempo = view.getFloat64(8, true);
+    const duration = view.getFloat64(16, true);
+    const count = view.getUint32(24, true);
+    const timesLength = view.getUint32(28, true);
+    
+    let offset = 36;
+    const difficulty = new TextDecoder().decode(bytes.subarray(offset, offset + difficultyLength));
+    offset += difficultyLength;
+    const laneTypes = bytes.subarray(offset, offset + count);
+    offset += count;
+    const intensities = bytes.subarray(offset, offset + count);
+    offset += count;
+    
+    // varint: 每字节低7位为数据，最高位表示后面还有字节
+    const readVarint = () => {
+        let value = 0;
+        let scale = 1;
+        let byte;
+        do {
+            byte = bytes[offset++];
+            value += (byte & 0x7f) * scale;
+            scale *= 128;
+        } while (byte & 0x80);
+        return value;
+    };
+    
+    const notes = new Array(count);
+    let ticks = 0;
+    for (let i = 0; i < count; i++) {
+        ticks += readVarint();
+        notes[i] = {
+            time: ticks * timeUnit,
+            lane: laneTypes[i] & 0x0f,
+            type: NOTE_TYPES[laneTypes[i] >> 4],
+            duration: 0,
+            intensity: intensities[i] / 255
+        };
+    }
+    offset = 36 + difficultyLength + 2 * count + timesLength;
+    for (let i = 0; i < count; i++) {
+        notes[i].duration = readVarint() * timeUnit;
+    }
+    
+    return { tempo, duration, difficulty, notes };
+}
+
+/**
+ * 加载谱面，优先请求二进制格式
+ * @param {string} sessionId 会话ID
+ * @param {string} level 难度级别
+ * @returns {Promise<Object>} 谱面数据
+ */
+function fetchChart(sessionId, level) {
+    return fetch(`/api/chart/${sessionId}?difficulty=${encodeURIComponent(level)}`, {
+        headers: { 'Accept': `${CHART_BINARY_MIMETYPE}, application/json;q=0.9` }
+    }).then(response => {
+        const contentType = response.headers.get('Content-Type') || '';
+        if (contentType.startsWith(CHART_BINARY_MIMETYPE)) {
+            return response.arrayBuffer().then(decodeBinaryChart);
+        }
+        return response.json();
+    });
+}
+
+/**
+ * 等待后台分析任务完成
+ * @param {string} jobId 任务ID
+ * @returns {Promise<Object>} 任务最终状态
+ */
+function waitForJob(jobId) {
+    const jobStatus = document.getElementById('job-status');
+    const jobProgress = document.getElementById('job-progress');
+    
+    const poll = () => fetch(`/api/jobs/${jobId}/wait?timeout=2`)
+        .then(response => response.json())
+        .then(status => {
+            // 任务记录已过期时直接尝试加载谱面
+            if (status.error && !status.status) {
+                return status;
+            }
+            if (status.status === 'failed') {
+                throw new Error(status.error || '谱面生成失败');
+            }
+            if (status.status === 'done') {
+                jobStatus.style.display = 'none';
+                return status;
+            }
+            
+            // 显示分析进度并继续等待
+            jobStatus.style.display = 'block';
+            jobProgress.textContent = `${Math.round(status.progress * 100)}%`;
+            return poll();
+        });
+    
+    return poll();
+}
+
 // 当页面加载完成时初始化游戏
 document.addEventListener('DOMContentLoaded', () => {
     const sessionId = document.getElementById('session-id').value;
     const audioPath = document.getElementById('audio-path').value;
+    const jobId = document.getElementById('job-id').value;
+    let difficulty = document.getElementById('difficulty').value;
     
-    // 加载谱面数据
-    fetch(`/api/chart/${sessionId}`)
-        .then(response => response.json())
+    // 等待谱面生成完成后再加载谱面数据
+    const jobReady = jobId ? waitForJob(jobId) : Promise.resolve();
+    const loadChart = level => fetchChart(sessionId, level);
+    
+    jobReady
+        .then(() => loadChart(difficulty))
         .then(chartData => {
             // 创建游戏实例
             const game = new RhythmGame({
@@ -737,6 +975,28 @@ document.addEventListener('DOMContentLoaded', () => {
                 const btnPause = document.getElementById('btn-pause');
                 btnPause.textContent = game.isPaused ? '继续' : '暂停';
             });
+            
+            // 切换难度：所有难度的谱面已经生成，直接加载对应谱面
+            const difficultyBtns = document.querySelectorAll('#difficulty-selection .difficulty-btn');
+            difficultyBtns.forEach(btn => {
+                btn.addEventListener('click', () => {
+                    const level = btn.getAttribute('data-value');
+                    if (level === difficulty) return;
+                    
+                    loadChart(level).then(newChart => {
+                        if (newChart.error) {
+                            throw new Error(newChart.error);
+                        }
+                        difficulty = level;
+                        game.setChart(newChart);
+                        difficultyBtns.forEach(b => b.classList.toggle('selected', b === btn));
+                        document.getElementById('btn-start').style.display = 'inline-block';
+                        document.getElementById('btn-restart').style.display = 'none';
+                    }).catch(error => {
+                        console.error('切换难度失败:', error);
+                    });
+                });
+            });
         })
         .catch(error => {
             console.error('加载谱面失败:', error);
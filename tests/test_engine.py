@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from src.chart.models import Chart
+from src.game.engine import GameEngine
+
+
+def make_chart(times, lanes):
+    """创建只包含点击音符的谱面"""
+    chart = Chart()
+    chart.add_notes(times, lanes, np.zeros(len(times), dtype=int))
+    return chart
+
+
+def play_live(chart, inputs):
+    """按时间顺序逐次调用 press，最后把剩余音符判为miss，模拟实际游戏"""
+    engine = GameEngine(chart)
+    engine.start_game()
+    results = []
+    for lane, hit_time in sorted(inputs, key=lambda item: item[1]):
+        note, result = engine.press(lane, hit_time)
+        results.append((None if note is None else note.time, result))
+    engine.expire_notes(float('inf'))
+    return engine.calculate_final_score(), results
+
+
+def verify(chart, inputs):
+    """使用 verify_replay 批量判定"""
+    return GameEngine(chart).verify_replay(inputs)
+
+
+def test_press_matches_closest_note_like_client():
+    chart = make_chart([1.00, 1.12], [0, 0])
+    inputs = [(0, 1.11)]
+
+    live, results = play_live(chart, inputs)
+    assert results == [(1.12, 'perfect')]
+    assert live['score'] == 100
+    assert live['perfect'] == 1
+    assert live['miss'] == 1
+    assert verify(chart, inputs) == live
+
+
+@pytest.mark.parametrize('offset, expected', [
+    (0.05, 'perfect'),
+    (-0.05, 'perfect'),
+    (0.1, 'great'),
+    (0.15, 'good'),
+    (0.2, 'miss'),
+    (np.nextafter(0.2, 1.0), None),
+])
+def test_window_edges_are_inclusive(offset, expected):
+    # 音符在0秒时，按键与音符的时间差恰好等于 game.js 中的窗口边界
+    chart = make_chart([0.0], [0])
+    inputs = [(0, 0.0 + offset)]
+
+    live, results = play_live(chart, inputs)
+    assert results[0][1] == expected
+    assert verify(chart, inputs) == live
+
+
+def test_expiry_edge_uses_strict_comparison():
+    # 另一条轨道上的按键触发过期检查：恰好 0.2 秒时音符仍可判定，之后才判为miss
+    chart = make_chart([0.0, 0.0], [0, 1])
+    for expire_at, expected in ((0.2, 'miss'), (np.nextafter(0.2, 1.0), None)):
+        inputs = [(1, 0.0), (1, expire_at), (0, expire_at)]
+        live, results = play_live(chart, inputs)
+        assert results[-1][1] == expected
+        assert verify(chart, inputs) == live
+
+
+def test_tie_goes_to_earlier_note():
+    chart = make_chart([1.0, 1.25], [0, 0])
+    inputs = [(0, 1.125), (0, 1.25)]
+
+    live, results = play_live(chart, inputs)
+    assert results == [(1.0, 'good'), (1.25, 'perfect')]
+    assert verify(chart, inputs) == live
+
+
+def test_verify_replay_matches_press_on_random_inputs():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        note_count = int(rng.integers(1, 60))
+        times = np.sort(rng.choice(np.arange(0, 30.0, 0.05), note_count, replace=False))
+        chart = make_chart(times, rng.integers(0, 4, note_count))
+
+        # 大部分按键落在音符附近，另外加入一些随机的多余按键
+        columns = chart.columns()
+        hits = rng.random(note_count) < 0.8
+        inputs = list(zip(columns['lane'][hits].tolist(),
+                          (columns['time'][hits] + rng.normal(0, 0.1, hits.sum())).tolist()))
+        inputs += [(int(lane), float(t)) for lane, t in
+                   zip(rng.integers(0, 4, 10), rng.uniform(0, 30, 10))]
+
+        live, _ = play_live(chart, inputs)
+        assert verify(chart, inputs) == live